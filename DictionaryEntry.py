@@ -1,9 +1,11 @@
 import xml.etree.ElementTree as ElementTree
-import sqlite3
+import instrumentation
 
 from dataclasses import dataclass
 from typing import List, Optional, Set, Dict
 
+from lookup_store import open_store
+
 VERB_BADGES = ["Ichidan", "Ichidan (くれる)", "Godan (〜ある)", "Godan (〜ぶ)", "Godan (〜ぐ)",
                "Godan (いく・ゆく)", "Godan (〜く)", "Godan (〜む)", "Godan (〜ぬ)",
                "Godan Irregular (〜る)", "Godan (〜る)", "Godan (〜す)",
@@ -21,8 +23,6 @@ SIMPLIFICATIONS = {
     **{x: "Noun" for x in NOUN_BADGES}
 }
 
-DB = sqlite3.connect("output/dictionary.db")
-
 
 class Entry:
     def __init__(self, page_title: str, language: str, entry_type: str):
@@ -36,18 +36,6 @@ class Sentence:
     japanese: str
 
 
-SENTENCES = {}
-SENTENCE_WORDS = {}
-
-for index, en, jp in DB.execute("SELECT id, en, jp FROM Sentences").fetchall():
-    SENTENCES[index] = Sentence(en, jp)
-
-for word, index in DB.execute("SELECT word, id FROM SentenceWords").fetchall():
-    if word in SENTENCE_WORDS:
-        SENTENCE_WORDS[word].append(SENTENCES[index])
-    else:
-        SENTENCE_WORDS[word] = [SENTENCES[index]]
-
 
 @dataclass
 class Definition:
@@ -67,6 +55,9 @@ class Translation:
 class Reading:
     text: str
     info: List[str]
+    # Normalised forms of the reading, see dictionary_converter.normalise_reading
+    hiragana: Optional[str] = None
+    romaji: Optional[str] = None
 
 
 class JapaneseEntry(Entry):
@@ -101,11 +92,12 @@ class JapaneseEntry(Entry):
         for reading in tag.findall("reading"):
             name = reading.attrib["text"]
             info = [x.text for x in reading.findall("info")]
-            result.append(Reading(name, info))
+            result.append(Reading(name, info, reading.attrib.get("hiragana"), reading.attrib.get("romaji")))
         return result
 
     def _get_sentences(self):
-        return SENTENCE_WORDS.get(self.page_title, [])
+        with instrumentation.current_stage().timed("db lookups"):
+            return [Sentence(en, jp) for en, jp in open_store("sentences").get(self.page_title)]
 
     def _get_containing_kanji(self, tag: ElementTree.Element) -> List[str]:
         result = []
@@ -120,9 +112,14 @@ class JapaneseEntry(Entry):
 
 
 class EnglishEntry(Entry):
-    def __init__(self, root_word: str):
-        super().__init__(root_word, "en", "dictionary")
+    def __init__(self, root_word: str, entry_type: str = "dictionary"):
+        super().__init__(root_word, "en", entry_type)
         self.translations: List[Translation] = []
+        # The number the first translation is shown with
+        self.first_number: int = 1
+        # The page with the translations past the cap (see combiner.py), and how many it has
+        self.overflow_id: Optional[str] = None
+        self.overflow_count: int = 0
 
     def add_translation(self, japanese_word: str, context: List[str], parts_of_speech: List[str]):
         # Reduce the complexity of the part of speech indicator (e.g. "Godan (く)" -> "Verb")
@@ -139,6 +136,14 @@ class EnglishEntry(Entry):
         return sorted(list({SIMPLIFICATIONS.get(x, x) for x in speech_parts}))
 
 
+class EnglishOverflowEntry(EnglishEntry):
+    # The less common translations of an English word with too many to show on its page. The page
+    # isn't indexed, it's only reached from the link on the word's page.
+    def __init__(self, root_word: str, first_number: int):
+        super().__init__(root_word, "overflow")
+        self.first_number = first_number
+
+
 class KanjiEntry(Entry):
     RADICALS = [
         "⼀", "⼁", "⼂", "⼃", "⼄", "⼅", "⼆", "⼇", "⼈", "⼉", "⼊", "⼋", "⼌", "⼍", "⼎", "⼏", 
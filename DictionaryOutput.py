@@ -1,12 +1,18 @@
 import xml.etree.ElementTree as ElementTree
 
 from itertools import chain
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from DictionaryEntry import Entry, JapaneseEntry, EnglishEntry, KanjiEntry
+from typing import Iterable, Optional
+from xml.sax.saxutils import quoteattr
+from DictionaryEntry import Entry, JapaneseEntry, EnglishEntry, EnglishOverflowEntry, KanjiEntry
+from size_profiler import SizeProfile
+from template_compiler import load_environment
 
 
 class DictionaryOutput:
-    def __init__(self, pages):
+    def __init__(self, pages: Iterable[Entry] = (), template_path: Optional[str] = None):
+        # When entries are rendered one at a time (see combiner.py) pages is left empty, and the
+        # titles of the Japanese entries are added with add_full_entry before the kanji pages
+        pages = list(pages)
         dict_entries = filter(lambda x: isinstance(x, JapaneseEntry), pages)
         self.full_entries = set(map(lambda x: x.page_title, dict_entries))
 
@@ -17,30 +23,43 @@ class DictionaryOutput:
                 "xmlns:d": "http://www.apple.com/DTDs/DictionaryService-1.0.rng"
             }
         )
-        self.environment = Environment(
-            loader=FileSystemLoader("assets"),
-            autoescape=select_autoescape(
-                enabled_extensions=('html', 'xml'),
-                default_for_string=True
-            )
-        )
+        # Use the templates compiled by template_compiler if given, otherwise compile them from assets
+        self.environment = load_environment(template_path)
         self.templates = {
             KanjiEntry: self.environment.get_template("kanji_page.html"),
             JapaneseEntry: self.environment.get_template("japanese_definition_page.html"),
             EnglishEntry: self.environment.get_template(
                 "english_definition_page.html")
         }
+        self.templates[EnglishOverflowEntry] = self.templates[EnglishEntry]
+        # Set to a SizeProfile to record the size of every entry and its sections as it's rendered
+        self.profile: Optional[SizeProfile] = None
 
         for page in pages:
-            self.generate_entry(page)
+            self.root.append(self.generate_entry(page))
+
+    def add_full_entry(self, page: JapaneseEntry):
+        self.full_entries.add(page.page_title)
+
+    def header(self) -> bytes:
+        # The start of the document as ElementTree writes it, for writing the entries one at a time
+        attributes = "".join(" {}={}".format(x, quoteattr(y)) for x, y in self.root.attrib.items())
+        return "<?xml version='1.0' encoding='UTF-8'?>\n<{}{}>".format(self.root.tag, attributes).encode("UTF-8")
+
+    def footer(self) -> bytes:
+        return "</{}>".format(self.root.tag).encode("UTF-8")
+
+    @staticmethod
+    def serialise_entry(xml_page: ElementTree.Element) -> bytes:
+        return ElementTree.tostring(xml_page, encoding="UTF-8", xml_declaration=False)
 
     def has_full_entry(self, kanji_page: KanjiEntry):
         return kanji_page.page_title in self.full_entries
 
     def _generate_full_entry(self, page: Entry):
         # Create the primary node
-        xml_page = ElementTree.SubElement(
-            self.root, "d:entry", {
+        xml_page = ElementTree.Element(
+            "d:entry", {
                 "id": page.page_id, "d:title": page.page_title}
         )
 
@@ -59,16 +78,31 @@ class DictionaryOutput:
             attribs = {"d:yomi": reading, "d:title": page.page_title, "d:value": reading}
             ElementTree.SubElement(xml_page, "d:index", attribs)
 
+        if isinstance(page, JapaneseEntry):
+            # Also find the entry by its reading in hiragana (for katakana readings) and in romaji
+            added = set(readings)
+            for reading in page.readings:
+                if reading.hiragana and reading.hiragana not in added:
+                    attribs = {"d:yomi": reading.hiragana, "d:title": page.page_title, "d:value": reading.hiragana}
+                    ElementTree.SubElement(xml_page, "d:index", attribs)
+                    added.add(reading.hiragana)
+                if reading.romaji and reading.romaji not in added:
+                    attribs = {"d:title": page.page_title, "d:value": reading.romaji}
+                    ElementTree.SubElement(xml_page, "d:index", attribs)
+                    added.add(reading.romaji)
+
         html_page = self.generate_page(page)
 
         for element in ElementTree.fromstring(html_page):
             xml_page.append(element)
 
-    def _generate_kanji_entry(self, page: Entry):
+        return xml_page
+
+    def _generate_unindexed_entry(self, page: Entry, title: str):
         # Create the primary node
-        attribs = {"id": page.page_id, "d:title":  f"{page.page_title} (Kanji Form)"}
-        xml_page = ElementTree.SubElement(
-            self.root, "d:entry", attribs
+        attribs = {"id": page.page_id, "d:title": title}
+        xml_page = ElementTree.Element(
+            "d:entry", attribs
         )
 
         html_page = self.generate_page(page)
@@ -76,13 +110,22 @@ class DictionaryOutput:
         for element in ElementTree.fromstring(html_page):
             xml_page.append(element)
 
-    def generate_entry(self, page: Entry):
+        return xml_page
+
+    def generate_entry(self, page: Entry) -> ElementTree.Element:
         # If this is a kanji entry, and the kanji doesn't appear in the full dictionary
         # then add an index and make it searchable
         if isinstance(page, KanjiEntry) and self.has_full_entry(page):
-            self._generate_kanji_entry(page)
+            xml_page = self._generate_unindexed_entry(page, f"{page.page_title} (Kanji Form)")
+        elif isinstance(page, EnglishOverflowEntry):
+            xml_page = self._generate_unindexed_entry(page, f"{page.page_title} (More Translations)")
         else:
-            self._generate_full_entry(page)
+            xml_page = self._generate_full_entry(page)
+
+        if self.profile is not None:
+            self.profile.add(type(page).__name__, page.page_id, xml_page)
+
+        return xml_page
 
     def generate_page(self, page):
         return self.templates[type(page)].render(entry=page)
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from typing import Dict, List, Tuple
+
+import build
+import synthetic_inputs
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+
+BASELINE = os.path.join(REPOSITORY, "benchmarks", "baseline.json")
+
+# The Python stages of the build, in an order that satisfies their dependencies, with their
+# arguments relative to the working directory
+STAGES: List[Tuple[str, List[str]]] = [(x.name, x.arguments) for x in build.create_stages() if x.python]
+
+# Measurements taken from each stage report
+METRICS = ["wall_time", "cpu_time", "peak_rss", "throughput"]
+# Timings are taken from the fastest repeat, the one least slowed down by anything else running on
+# the machine. The other metrics are the median of the repeats.
+TIMES = {"wall_time", "cpu_time"}
+# The metrics compared against the baseline, each with the smallest increase that counts as a
+# regression whatever the tolerance, as changes below it are measurement noise. Wall time and
+# throughput depend too much on whatever else the machine is doing to be compared.
+COMPARED = {"cpu_time": 0.1, "peak_rss": 8 * 2**20}
+
+
+def prepare_workspace(directory: str, scale: float, seed: int) -> Dict[str, int]:
+    # Lay the workspace out like the repository, so that the stages' relative paths resolve
+    counts = synthetic_inputs.write_inputs(os.path.join(directory, "input"), scale, seed)
+
+    os.makedirs(os.path.join(directory, "output"))
+    os.makedirs(os.path.join(directory, "build", "OtherResources", "Images"))
+
+    # The templates are shared with the repository, but KanjiVG is replaced by synthetic images
+    assets = os.path.join(directory, "assets")
+    os.makedirs(assets)
+    for name in os.listdir(os.path.join(REPOSITORY, "assets")):
+        os.symlink(os.path.join(REPOSITORY, "assets", name), os.path.join(assets, name))
+
+    characters = [chr(0x4e00 + x) for x in range(counts["characters"])]
+    synthetic_inputs.write_kanjivg(os.path.join(assets, "kanjivg.tar.xz"), characters, seed)
+
+    return counts
+
+
+def run_stage(directory: str, name: str, arguments: List[str]) -> Dict:
+    script, *arguments = arguments
+    reports = os.path.join(directory, "output", "reports")
+
+    environment = dict(os.environ, BUILD_REPORT_DIR=reports, PYTHONPATH=REPOSITORY)
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPOSITORY, script), *arguments],
+        cwd=directory, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError("Stage {} failed:\n{}".format(name, result.stderr.decode()))
+
+    with open(os.path.join(reports, "{}.json".format(name))) as in_file:
+        return json.load(in_file)
+
+
+def run_workspace(scale: float, seed: int, stages: List[str]) -> Tuple[Dict[str, int], Dict[str, Dict]]:
+    # Runs every stage once on fresh inputs, returning the input counts and the reports of the given stages
+    directory = tempfile.mkdtemp(prefix="jdict-benchmark-")
+    try:
+        counts = prepare_workspace(directory, scale, seed)
+        reports = {}
+        # Every stage runs in its own process, after the stages it depends on
+        for name, arguments in STAGES:
+            report = run_stage(directory, name, arguments)
+            if name in stages:
+                reports[name] = report
+        return counts, reports
+    finally:
+        shutil.rmtree(directory)
+
+
+def summarise_runs(counts: Dict[str, int], runs: List[Dict[str, Dict]]) -> Dict:
+    result = {"inputs": counts, "stages": {}}
+    for name in runs[0]:
+        reports = [x[name] for x in runs]
+        result["stages"][name] = {
+            metric: (min if metric in TIMES else statistics.median)(x[metric] for x in reports)
+            for metric in METRICS
+        }
+        result["stages"][name]["records"] = reports[0]["records"]
+        result["stages"][name]["phases"] = {
+            phase: min(x["phases"][phase]["wall_time"] for x in reports)
+            for phase in reports[0]["phases"]
+        }
+
+    return result
+
+
+def run_scale(scale: float, seed: int, repeat: int, stages: List[str]) -> Dict:
+    runs = []
+    for _ in range(repeat):
+        counts, reports = run_workspace(scale, seed, stages)
+        runs.append(reports)
+    return summarise_runs(counts, runs)
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+
+    for scale, result in results.items():
+        if scale not in baseline:
+            continue
+
+        for name, stage in result["stages"].items():
+            previous = baseline[scale]["stages"].get(name)
+            if previous is None:
+                continue
+
+            for metric, floor in COMPARED.items():
+                if previous[metric] == 0:
+                    continue
+
+                change = (stage[metric] - previous[metric]) / previous[metric]
+                print("{:>6}x {:<42} {:<11} {:>12.4g} -> {:<12.4g} ({:+.1%})".format(
+                    scale, name, metric, previous[metric], stage[metric], change))
+
+                if change > tolerance and stage[metric] - previous[metric] > floor:
+                    regressions.append("{}x {} {} changed by {:+.1%}".format(scale, name, metric, change))
+
+    return regressions
+
+
+def print_results(results: Dict):
+    print("{:>7} {:<42} {:>9} {:>9} {:>10} {:>10} {:>12}".format(
+        "scale", "stage", "wall (s)", "cpu (s)", "rss (MB)", "records", "records/s"))
+
+    for scale, result in results.items():
+        for name, stage in result["stages"].items():
+            print("{:>6}x {:<42} {:>9.3f} {:>9.3f} {:>10.1f} {:>10} {:>12.1f}".format(
+                scale, name, stage["wall_time"], stage["cpu_time"], stage["peak_rss"] / 2**20,
+                stage["records"], stage["throughput"]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=float, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--stages", type=str, nargs="+", default=[x[0] for x in STAGES])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=str, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="fail if the results regress from the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Checked before running anything, rather than after minutes of benchmarks
+    if args.compare and not os.path.exists(args.baseline):
+        parser.error("No baseline at {}, create one with --save-baseline".format(args.baseline))
+
+    results = {}
+    for scale in args.scales:
+        # Use the same key format as the JSON file (i.e. "10" rather than "10.0")
+        key = "{:g}".format(scale)
+        results[key] = run_scale(scale, args.seed, args.repeat, args.stages)
+
+    print_results(results)
+
+    if args.compare:
+        with open(args.baseline) as in_file:
+            baseline = json.load(in_file)
+
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against {}:\n    {}".format(args.baseline, "\n    ".join(regressions)))
+            sys.exit(1)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as out_file:
+            json.dump(results, out_file, indent=2)
+        print("Saved baseline to {}".format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
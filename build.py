@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import instrumentation
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+
+# The stages that have finished, so that --resume can carry on after a failed or killed build
+STATE_PATH = "output/build_state.json"
+
+
+@dataclass
+class Stage:
+    name: str
+    # The command to run. For Python stages the first argument is the script, relative to the repository.
+    arguments: List[str]
+    # Names of the stages that must finish before this one can start
+    dependencies: List[str] = field(default_factory=list)
+    python: bool = True
+    # Whether the stage checkpoints its progress, and takes --resume to carry on from it
+    resumable: bool = False
+
+    # Filled in as the build runs
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    return_code: Optional[int] = None
+    skipped: bool = False
+    # Finished by an earlier build, and not run again by --resume
+    reused: bool = False
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    def command(self, resume: bool = False) -> List[str]:
+        arguments = self.arguments + (["--resume"] if resume and self.resumable else [])
+        if self.python:
+            script, *arguments = arguments
+            return [sys.executable, os.path.join(REPOSITORY, script), *arguments]
+        return arguments
+
+
+def create_stages(input_directory: str = "input", jmdict: str = "JMdict_e.xml",
+                  kanjidic: str = "kanjidic2.xml") -> List[Stage]:
+    # The dependency graph of the build. Each stage lists only the outputs it really reads, so that
+    # e.g. the sentence conversion (MeCab) runs alongside all of the kanji and dictionary stages.
+    # The stages are listed in an order that satisfies their dependencies.
+    def source(name: str) -> str:
+        return os.path.join(input_directory, name)
+
+    jmdict, kanjidic = source(jmdict), source(kanjidic)
+
+    return [
+        Stage("sentence_converter", ["sentence_converter.py", source("sentences.csv"), source("jpn_indices.csv"), "-o", "output/dictionary.db"],
+              resumable=True),
+        Stage("kanji_relation_db", ["kanji_relation_db.py", "--kanjidic", source("kanjidic2.xml"),
+                                    "--stroke-distance", source("stroke_distance.csv"),
+                                    "--radical-distance", source("radical_distance.csv")]),
+        Stage("lookup_store_kanji_meanings_similar_kanji",
+              ["lookup_store.py", "output/dictionary.db", "-o", "output", "--stores", "kanji_meanings", "similar_kanji"],
+              ["kanji_relation_db"]),
+        Stage("lookup_store_sentences",
+              ["lookup_store.py", "output/dictionary.db", "-o", "output", "--stores", "sentences"],
+              ["sentence_converter"]),
+        Stage("kanjidic_converter", ["kanjidic_converter.py", kanjidic],
+              ["lookup_store_kanji_meanings_similar_kanji"]),
+        Stage("dictionary_converter", ["dictionary_converter.py", jmdict],
+              ["lookup_store_kanji_meanings_similar_kanji"]),
+        Stage("english_entry_generator", ["english_entry_generator.py"], ["dictionary_converter"]),
+        Stage("deinflection_generator", ["deinflection_generator.py", "output/dictionary.xml", "-o", "output/dictionary.db"],
+              ["dictionary_converter"]),
+        Stage("trie_index", ["trie_index.py", "output/dictionary.xml", "-o", "output/headwords.trie"],
+              ["dictionary_converter"]),
+        # Only the stroke order images of kanji with a page are extracted from KanjiVG
+        Stage("kanjivg_extractor",
+              ["kanjivg_extractor.py", "assets/kanjivg.tar.xz", "output/kanji.xml", "build/OtherResources/Images",
+               "-o", "output/kanji_images.txt", "--minify"],
+              ["kanjidic_converter"]),
+        Stage("template_compiler", ["template_compiler.py", "-o", "output/templates"]),
+        Stage("combiner",
+              ["combiner.py", "output/dictionary.xml", "output/kanji.xml", source("english.txt"), "-o", "build/JapaneseDictionary.xml",
+               "--images", "output/kanji_images.txt", "--templates", "output/templates"],
+              ["kanjivg_extractor", "lookup_store_sentences", "kanjidic_converter", "english_entry_generator",
+               "template_compiler"],
+              resumable=True),
+        # Catches malformed pages, duplicate ids and broken links in seconds, rather than at the end
+        # of the (much longer) Dictionary Development Kit build
+        Stage("dictionary_validator", ["dictionary_validator.py", "build/JapaneseDictionary.xml"], ["combiner"]),
+    ]
+
+
+def check_graph(stages: List[Stage]):
+    names = {x.name for x in stages}
+    for stage in stages:
+        for dependency in stage.dependencies:
+            if dependency not in names:
+                raise ValueError("Stage {} depends on unknown stage {}".format(stage.name, dependency))
+
+    # Kahn's algorithm: stages are removed once everything they depend on has been, so any left over
+    # are in a cycle or wait on one, and would never start
+    waiting = {x.name: len(set(x.dependencies)) for x in stages}
+    dependents: Dict[str, List[str]] = {x.name: [] for x in stages}
+    for stage in stages:
+        for dependency in set(stage.dependencies):
+            dependents[dependency].append(stage.name)
+
+    ready = [name for name, count in waiting.items() if count == 0]
+    while ready:
+        for dependent in dependents[ready.pop()]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                ready.append(dependent)
+
+    cycle = [name for name, count in waiting.items() if count > 0]
+    if cycle:
+        raise ValueError("Stages {} are in, or depend on, a dependency cycle".format(", ".join(cycle)))
+
+
+def load_state() -> List[str]:
+    if not os.path.exists(STATE_PATH):
+        return []
+    with open(STATE_PATH) as in_file:
+        return json.load(in_file)["finished"]
+
+
+def save_state(stages: Dict[str, Stage]):
+    finished = [x.name for x in stages.values() if x.return_code == 0]
+    with open(STATE_PATH, "w") as out_file:
+        json.dump({"finished": finished}, out_file, indent=2)
+
+
+async def run_stage(stage: Stage, stages: Dict[str, Stage], done: Dict[str, asyncio.Event],
+                    limit: asyncio.Semaphore, log_directory: str, start: float, resume: bool):
+    if stage.reused:
+        done[stage.name].set()
+        return
+
+    # Wait for everything this stage reads to be written
+    for dependency in stage.dependencies:
+        await done[dependency].wait()
+        if stages[dependency].return_code != 0:
+            # Skip the stage, and let the stages that depend on it skip too
+            stage.skipped = True
+            done[stage.name].set()
+            return
+
+    async with limit:
+        stage.started = time.perf_counter() - start
+        print("[{:8.1f}s] Started {}".format(stage.started, stage.name))
+
+        # Resumed stages add to the log of their interrupted run
+        with open(os.path.join(log_directory, "{}.log".format(stage.name)), "ab" if resume else "wb") as log:
+            process = await asyncio.create_subprocess_exec(
+                *stage.command(resume), stdout=log, stderr=asyncio.subprocess.STDOUT
+            )
+            stage.return_code = await process.wait()
+
+        stage.finished = time.perf_counter() - start
+        status = "Finished" if stage.return_code == 0 else "FAILED"
+        print("[{:8.1f}s] {} {} ({:.1f}s)".format(stage.finished, status, stage.name, stage.duration))
+        save_state(stages)
+
+    done[stage.name].set()
+
+
+async def run_stages(stages: List[Stage], jobs: int, log_directory: str, resume: bool = False):
+    by_name = {x.name: x for x in stages}
+    done = {x.name: asyncio.Event() for x in stages}
+    limit = asyncio.Semaphore(jobs)
+    start = time.perf_counter()
+
+    await asyncio.gather(*(run_stage(x, by_name, done, limit, log_directory, start, resume) for x in stages))
+
+
+def critical_path(stages: List[Stage]) -> List[Stage]:
+    # The chain of dependent stages with the largest total duration. Speeding up anything that
+    # isn't on it can't make the build finish sooner.
+    by_name = {x.name: x for x in stages}
+    longest: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+
+    def visit(name: str) -> float:
+        if name not in longest:
+            stage = by_name[name]
+            best, best_dependency = 0.0, None
+            for dependency in stage.dependencies:
+                if visit(dependency) > best:
+                    best, best_dependency = longest[dependency], dependency
+            longest[name] = best + stage.duration
+            previous[name] = best_dependency
+        return longest[name]
+
+    name = max((x.name for x in stages), key=visit)
+
+    path = []
+    while name is not None:
+        path.append(by_name[name])
+        name = previous[name]
+    return list(reversed(path))
+
+
+def print_failure(stage: Stage, log_directory: str, lines: int = 20):
+    print("\n{} failed with exit code {}. Last lines of its log:".format(stage.name, stage.return_code))
+    with open(os.path.join(log_directory, "{}.log".format(stage.name)), errors="replace") as log:
+        print("".join(log.readlines()[-lines:]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample", action="store_true", help="build from the sample JMdict and KANJIDIC2 files")
+    parser.add_argument("--input", type=str, default="input",
+                        help="directory of the downloads, e.g. a subset written by subset_inputs.py")
+    parser.add_argument("--jobs", "-j", type=int, default=3,
+                        help="maximum number of stages to run at once (each needs its own memory)")
+    parser.add_argument("--logs", type=str, default="output/logs")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip the stages an earlier build finished, and resume the interrupted ones from their checkpoints")
+    args = parser.parse_args()
+
+    if args.sample:
+        stages = create_stages(args.input, "JMdict_e_sample.xml", "kanjidic2_sample.xml")
+    else:
+        stages = create_stages(args.input)
+
+    check_graph(stages)
+    os.makedirs(args.logs, exist_ok=True)
+
+    if args.resume:
+        finished = load_state()
+        for stage in stages:
+            if stage.name in finished:
+                stage.reused, stage.return_code = True, 0
+                print("Already finished {}".format(stage.name))
+    elif os.path.exists(STATE_PATH):
+        os.remove(STATE_PATH)
+
+    start = time.perf_counter()
+    asyncio.run(run_stages(stages, args.jobs, args.logs, args.resume))
+    wall_time = time.perf_counter() - start
+
+    failed = [x for x in stages if not x.skipped and x.return_code != 0]
+    for stage in failed:
+        print_failure(stage, args.logs)
+
+    if failed:
+        skipped = [x.name for x in stages if x.skipped]
+        if skipped:
+            print("Skipped: {}".format(", ".join(skipped)))
+        sys.exit(1)
+
+    path = critical_path(stages)
+    print("\nCritical path ({:.1f}s of {:.1f}s wall time, {:.1f}s of stage time):".format(
+        sum(x.duration for x in path), wall_time, sum(x.duration for x in stages)))
+    for stage in path:
+        print("    {:<44} {:>8.1f}s".format(stage.name, stage.duration))
+
+    # Combine the per stage timing and memory reports into a single report for this build
+    print("\nBuild report:")
+    reports = instrumentation.load_reports(instrumentation.REPORT_DIRECTORY)
+    instrumentation.write_run_report(reports, "output/build_report.json", wall_time)
+    print(instrumentation.format_summary(reports))
+
+
+if __name__ == "__main__":
+    main()
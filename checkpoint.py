@@ -0,0 +1,61 @@
+import os
+import json
+import sqlite3
+
+from typing import Dict, Optional, Tuple
+
+
+class Checkpoint:
+    # The progress of a stage that commits its work to the database in batches. The checkpoint is
+    # saved in the same transaction as the batch, so the two can never disagree.
+    def __init__(self, db: sqlite3.Connection, stage: str):
+        self.db = db
+        self.stage = stage
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS Checkpoint (
+            stage TEXT PRIMARY KEY, -- Name of the stage
+            position INTEGER, -- Number of input records already committed
+            state TEXT -- JSON of anything else needed to carry on
+        )
+        """)
+
+    def load(self) -> Optional[Tuple[int, Dict]]:
+        row = self.db.execute("SELECT position, state FROM Checkpoint WHERE stage = ?", (self.stage, )).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def save(self, position: int, state: Dict):
+        # Doesn't commit, the caller commits it along with the batch
+        self.db.execute("INSERT OR REPLACE INTO Checkpoint VALUES (?, ?, ?)", (self.stage, position, json.dumps(state)))
+
+    def clear(self):
+        self.db.execute("DELETE FROM Checkpoint WHERE stage = ?", (self.stage, ))
+
+
+class FileCheckpoint:
+    # The progress of a stage writing a single output file: how many input records have been
+    # written, and the length of the file at that point
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.path = "{}.checkpoint".format(output_path)
+
+    def load(self) -> Optional[Tuple[int, Dict]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as in_file:
+            checkpoint = json.load(in_file)
+        return checkpoint["position"], checkpoint["state"]
+
+    def save(self, position: int, state: Dict):
+        # Written to a temporary file and renamed, so a crash never leaves a partial checkpoint
+        temporary = "{}.tmp".format(self.path)
+        with open(temporary, "w") as out_file:
+            json.dump({"position": position, "state": state}, out_file)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
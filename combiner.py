@@ -1,39 +1,47 @@
 import os
+import gzip
 import argparse
 import sqlite3
+import instrumentation
 import xml.etree.ElementTree as ElementTree
 
-from typing import Set, Dict, List
+from itertools import count, groupby
+from multiprocessing import Pool
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
 
-from DictionaryEntry import Entry, JapaneseEntry, EnglishEntry, KanjiEntry, Sentence
+from DictionaryEntry import Entry, JapaneseEntry, EnglishEntry, EnglishOverflowEntry, KanjiEntry, Sentence
 from DictionaryOutput import DictionaryOutput
-
-def get_stats(pages):
-    entries = {
-        "kanji": 0,
-        "english": 0,
-        "japanese": 0,
-        "other": 0,
-        "kanji_image": 0,
-    }
-
-    for entry in pages:
-        if isinstance(entry, KanjiEntry):
-            entries["kanji"] += 1
-            if entry.image:
-                entries["kanji_image"] += 1
-        elif isinstance(entry, JapaneseEntry):
-            entries["japanese"] += 1
-        elif isinstance(entry, EnglishEntry):
-            entries["english"] += 1
-        else:
-            entries["other"] += 1
-
+from checkpoint import FileCheckpoint
+from kanjivg_extractor import read_manifest
+from lookup_store import set_store_directory
+from pipeline import run_pipeline, format_statistics
+from shards import manifest_path, shard_of, shard_path, write_shard_manifest
+from size_profiler import SizeProfile, format_profile, write_profile
+
+# Translations shown on an English word's page, the rest are moved to an overflow page
+ENGLISH_TRANSLATIONS = 30
+
+def count_page(entries: Dict[str, int], entry: Entry):
+    if isinstance(entry, KanjiEntry):
+        entries["kanji"] += 1
+        if entry.image:
+            entries["kanji_image"] += 1
+    elif isinstance(entry, JapaneseEntry):
+        entries["japanese"] += 1
+    elif isinstance(entry, EnglishOverflowEntry):
+        entries["english_overflow"] += 1
+    elif isinstance(entry, EnglishEntry):
+        entries["english"] += 1
+    else:
+        entries["other"] += 1
+
+
+def get_stats(entries: Dict[str, int]):
     output_text = [
         "Created:",
         "{} kanji pages ({} with stroke order)".format(entries["kanji"], entries["kanji_image"]),
         "{} japanese entries".format(entries["japanese"]),
-        "{} english entries".format(entries["english"]),
+        "{} english entries ({} overflow pages)".format(entries["english"], entries["english_overflow"]),
         "{} other entries".format(entries["other"])
     ]
 
@@ -45,86 +53,380 @@ def get_arguments():
     parser.add_argument("dictionary", type=str)
     parser.add_argument("kanji", type=str)
     parser.add_argument("english_wordlist", type=str)
-    parser.add_argument("-o", type=str)
-    return parser.parse_args()
+    parser.add_argument("-o", type=str, help="output XML file, compressed with gzip if it ends in .gz")
+    parser.add_argument("--images", type=str, help="manifest of the stroke order images written by kanjivg_extractor")
+    parser.add_argument("--templates", type=str, help="directory of the templates compiled by template_compiler")
+    parser.add_argument("--stores", type=str, default="output", help="directory of the lookup stores")
+    parser.add_argument("--english-translations", type=int, default=ENGLISH_TRANSLATIONS,
+                        help="translations on each English page, the less common ones past this are moved to an "
+                             "overflow page (0 shows them all)")
+    parser.add_argument("--queue-size", type=int, default=256,
+                        help="entries buffered between the reader, renderer and writer threads")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="split the output into this many files, listed in a manifest (see shards.py)")
+    parser.add_argument("--workers", type=int, default=None, help="processes writing shards (default one per shard)")
+    parser.add_argument("--checkpoint-every", type=int, default=10000, help="entries written between checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from the last checkpoint of an interrupted run")
+    parser.add_argument("--size-profile", type=str,
+                        help="write the size of every entry and of each section of its page to this JSON file")
+    args = parser.parse_args()
+
+    if args.size_profile and args.resume:
+        # The entries written before the checkpoint aren't rendered again, so would be missing
+        parser.error("--size-profile can't be used with --resume")
+
+    return args
+
+
+def read_entries(path: str) -> Iterator[ElementTree.Element]:
+    # Stream the entries of kanji.xml or dictionary.xml instead of parsing the whole file
+    root = None
+    for event, tag in ElementTree.iterparse(path, ("start", "end")):
+        if root is None:
+            root = tag
+        elif event == "end" and tag.tag == "entry":
+            yield tag
+            # Drop the entry from the tree, it stays alive until the pipeline is done with it
+            root.clear()
+
+
+def read_english_translations() -> Iterator[Tuple[str, List[Tuple]]]:
+    db = sqlite3.connect("output/dictionary.db")
+    cursor = db.cursor()
 
+    # Sorted so that each English word's translations are read together, the most common Japanese
+    # words (see dictionary_converter.priority_rank) and earliest senses first
+    query = cursor.execute("""
+        SELECT en, explanation, jp, context, speech_parts, sense_index FROM EnglishTranslations
+        ORDER BY en, priority, sense_index, rowid
+    """)
+
+    for en, rows in groupby(query, key=lambda x: x[0]):
+        yield en, list(rows)
+
+    db.close()
+
+
+def read_pages(dict_path: str, kanji_path: str, english_translations: int = 0) -> Iterator[Tuple[str, Any]]:
+    # Japanese entries come first, so that every Japanese title is known by the time the kanji
+    # pages are rendered (see DictionaryOutput.has_full_entry)
+    for entry in read_entries(dict_path):
+        yield "japanese", entry
+    for entry in read_entries(kanji_path):
+        yield "kanji", entry
+    for en, rows in read_english_translations():
+        if english_translations and len(rows) > english_translations:
+            yield "english", (en, rows[:english_translations], len(rows) - english_translations)
+            yield "english_overflow", (en, rows[english_translations:], english_translations + 1)
+        else:
+            yield "english", (en, rows, 0)
 
-def create_kanji_pages(kanji_path: str, kanji_images: Set[str]) -> List[KanjiEntry]:
-    result = []
 
-    # Open the kanji XML file
-    tree = ElementTree.parse(kanji_path)
-    root = tree.getroot()
+def unique_page_id(page_id: str, page_ids: Dict[str, int]) -> str:
+    # Entries sharing a title get the ids <id>, <id>-0, <id>-1, ... in the order they're read.
+    # page_ids maps every id given out to the next suffix to try for it, so a title shared by many
+    # entries doesn't search through every earlier suffix again.
+    if page_id in page_ids:
+        original = page_id
+        suffix = page_ids[original]
+        while f"{original}-{suffix}" in page_ids:
+            suffix += 1
+        page_ids[original] = suffix + 1
+        page_id = f"{original}-{suffix}"
 
-    # Create all the pages for the kanji
-    for entry in root:
-        result.append(KanjiEntry(entry, kanji_images))
+    page_ids[page_id] = 0
+    return page_id
 
-    return result
 
+def create_japanese_page(entry: ElementTree.Element, page_ids: Dict[str, int]) -> Optional[JapaneseEntry]:
+    new_entry = JapaneseEntry(entry)
+    if not new_entry.is_worth_adding():
+        return None
 
-def create_japanese_pages(dict_path: str) -> List[JapaneseEntry]:
-    dictionary_tree = ElementTree.parse(dict_path)
-    dictionary_root = dictionary_tree.getroot()
+    new_entry.page_id = unique_page_id(new_entry.page_id, page_ids)
+    return new_entry
 
-    result = {}
 
-    for entry in dictionary_root:
-        new_entry = JapaneseEntry(entry)
-        if new_entry.is_worth_adding():
-            if new_entry.page_id in result:
-                # Deduplicate page ids (Kinda hacky, may fix later)
-                page_id = new_entry.page_id
-                for x in range(1000):
-                    page_id_new = f"{page_id}-{x}"
-                    if page_id_new not in result:
-                        new_entry.page_id = page_id_new
-            
-            result[new_entry.page_id] = new_entry
+def add_english_translations(page: EnglishEntry, translations: List[Tuple]):
+    for _, expl, jp, context, pos, sense in translations:
+        if expl != None:
+            page.add_translation(jp, [expl,], pos.split(", "))
+        else:
+            page.add_translation(jp, context.split(", "), pos.split(", "))
 
-    return list(result.values())
 
+def create_english_page(en: str, translations: List[Tuple], overflow: int = 0) -> EnglishEntry:
+    result = EnglishEntry(en)
+    add_english_translations(result, translations)
 
-def create_english_pages() -> List[EnglishEntry]:
-    db = sqlite3.connect("output/dictionary.db")
-    cursor = db.cursor()
+    if overflow:
+        result.overflow_id = EnglishOverflowEntry(en, 1).page_id
+        result.overflow_count = overflow
 
-    result: Dict[str, EnglishEntry] = dict()
+    return result
 
-    query = cursor.execute("SELECT * FROM EnglishTranslations")
 
-    for en, expl, jp, context, pos, sense in query.fetchall():
-        if en not in result:
-            result[en] = EnglishEntry(en)
-        
-        if expl != None:
-            result[en].add_translation(jp, [expl,], pos.split(", "))
-        else:
-            result[en].add_translation(jp, context.split(", "), pos.split(", "))
+def create_english_overflow_page(en: str, translations: List[Tuple], first_number: int) -> EnglishOverflowEntry:
+    result = EnglishOverflowEntry(en, first_number)
+    add_english_translations(result, translations)
+    return result
 
-    return list(result.values())
 
+def open_output(path: str) -> BinaryIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, "wb")
+    return open(path, "wb")
+
+
+def plan_page_id(entry: ElementTree.Element, seen: Dict[str, int]) -> Optional[str]:
+    # The page id create_japanese_page gives the entry (None if it doesn't get a page), without
+    # building the JapaneseEntry
+    if not any(x.find("translation") is not None for x in entry.findall("definition")):
+        return None
+
+    return unique_page_id("jp_dictionary_{}".format(entry.attrib["title"]), seen)
+
+
+def plan_japanese_pages(dict_path: str) -> Tuple[List[Optional[str]], Set[str]]:
+    # The page id of every entry in dictionary.xml, and the titles that get a page. Lets each shard
+    # decide which Japanese entries are its own without building the rest.
+    page_ids: List[Optional[str]] = []
+    seen: Dict[str, int] = {}
+    titles: Set[str] = set()
+
+    for entry in read_entries(dict_path):
+        page_id = plan_page_id(entry, seen)
+        if page_id is not None:
+            titles.add(entry.attrib["title"])
+        page_ids.append(page_id)
+
+    return page_ids, titles
+
+
+def write_dictionary(args: argparse.Namespace, path: str, report: instrumentation.StageReport,
+                     shard: int = 0, shards: int = 1,
+                     plan: Optional[Tuple[List[Optional[str]], Set[str]]] = None) -> Dict:
+    # Renders the dictionary, or with a plan only the pages of one shard, to path
+    # Set here so that the shards' worker processes (which aren't forked on every platform) use it too
+    set_store_directory(args.stores)
+
+    if args.images:
+        image_set = read_manifest(args.images)
+    else:
+        image_set = set(filter(lambda x: ".svg" in x, os.listdir("./build/OtherResources/Images")))
+
+    dictionary = DictionaryOutput(template_path=args.templates)
+    if args.size_profile:
+        dictionary.profile = SizeProfile()
+    entries = {"kanji": 0, "english": 0, "english_overflow": 0, "japanese": 0, "other": 0, "kanji_image": 0}
+    # Bytes of the English pages and of their overflow pages
+    english_bytes = {"pages": 0, "overflow": 0}
+    page_ids: Dict[str, int] = {}
+    japanese_index = count()
+
+    if plan is not None:
+        planned_ids, dictionary.full_entries = plan
+
+    # Every few thousand entries the output is flushed to disk and the number of input items done
+    # is saved, along with the length of the file. A gzip stream can't be cut off and carried on,
+    # so compressed output has no checkpoints.
+    checkpoint = None if path.endswith(".gz") else FileCheckpoint(path)
+    if args.resume and checkpoint is None:
+        raise ValueError("Can't resume writing the compressed output {}".format(path))
+
+    saved = checkpoint.load() if args.resume else None
+    if saved is None:
+        skip = 0
+        if checkpoint is not None:
+            checkpoint.clear()
+    else:
+        skip, state = saved
+        offset = state["bytes"]
+        entries = state["entries"]
+        english_bytes = state["english_bytes"]
+        print("Resuming {} after {} input entries".format(path, skip))
+
+    def replay(kind: str, value: Any):
+        # Items before the checkpoint are already written, but the state that later pages depend
+        # on (the deduplicated Japanese page ids, and which titles have a full entry) is rebuilt
+        if kind != "japanese":
+            return
+        if plan is not None:
+            next(japanese_index)
+        elif plan_page_id(value, page_ids) is not None:
+            dictionary.full_entries.add(value.attrib["title"])
+
+    def transform(item: Tuple[int, Tuple[str, Any]]) -> Optional[Tuple[int, Entry, ElementTree.Element]]:
+        index, (kind, value) = item
+
+        if index < skip:
+            replay(kind, value)
+            return None
+
+        if plan is not None:
+            # Skip the pages of other shards before doing any work on them
+            if kind == "japanese":
+                page_id = planned_ids[next(japanese_index)]
+            elif kind == "kanji":
+                page_id = "jp_kanji_{}".format(value.attrib["title"])
+            elif kind == "english_overflow":
+                page_id = "en_overflow_{}".format(value[0])
+            else:
+                page_id = "en_dictionary_{}".format(value[0])
+            if page_id is None or shard_of(page_id, shards) != shard:
+                return None
+
+        with report.timed("{} pages".format(kind)) as phase:
+            if kind == "japanese" and plan is not None:
+                page = JapaneseEntry(value)
+                page.page_id = page_id
+            elif kind == "japanese":
+                page = create_japanese_page(value, page_ids)
+                if page is None:
+                    return None
+                dictionary.add_full_entry(page)
+            elif kind == "kanji":
+                page = KanjiEntry(value, image_set)
+            elif kind == "english_overflow":
+                page = create_english_overflow_page(*value)
+            else:
+                page = create_english_page(*value)
+            phase.records += 1
+
+        with report.timed("render", 1):
+            xml_page = dictionary.generate_entry(page)
+
+        return index, page, xml_page
+
+    if saved is None:
+        out_file = open_output(path)
+        out_file.write(dictionary.header())
+        offset = len(dictionary.header())
+    else:
+        # Drop anything written after the checkpoint
+        out_file = open(path, "r+b")
+        out_file.truncate(offset)
+        out_file.seek(offset)
+
+    unsaved = 0
+
+    with out_file:
+        def write(item: Tuple[int, Entry, ElementTree.Element]):
+            # Runs on the writer thread, alongside the reading and rendering
+            nonlocal offset, unsaved
+            index, page, xml_page = item
+            data = dictionary.serialise_entry(xml_page)
+            out_file.write(data)
+            offset += len(data)
+            count_page(entries, page)
+            if isinstance(page, EnglishOverflowEntry):
+                english_bytes["overflow"] += len(data)
+            elif isinstance(page, EnglishEntry):
+                english_bytes["pages"] += len(data)
+
+            unsaved += 1
+            if checkpoint is not None and unsaved >= args.checkpoint_every:
+                out_file.flush()
+                os.fsync(out_file.fileno())
+                checkpoint.save(index + 1, {"bytes": offset, "entries": entries, "english_bytes": english_bytes})
+                unsaved = 0
+
+        with report.phase("pipeline"):
+            pages = read_pages(args.dictionary, args.kanji, args.english_translations)
+            statistics = run_pipeline(enumerate(pages), transform, write, args.queue_size)
+        out_file.write(dictionary.footer())
+
+    if checkpoint is not None:
+        checkpoint.clear()
+
+    output_bytes = offset - len(dictionary.header())
+    report.count("output bytes", output_bytes)
+    report.count("english page bytes", english_bytes["pages"])
+    report.count("english overflow bytes", english_bytes["overflow"])
+    report.metrics["pipeline"] = statistics
+    report.add_records(sum(entries.values()) - entries["kanji_image"])
+
+    return {
+        "path": path,
+        "entries": entries,
+        "bytes": output_bytes,
+        "header": dictionary.header().decode("UTF-8"),
+        "footer": dictionary.footer().decode("UTF-8"),
+        "pipeline": statistics,
+        "english_bytes": english_bytes,
+        "size_profile": dictionary.profile,
+    }
 
-def main():
-    args = get_arguments()
 
-    # This will contain all the pages for the dictionary as they are added
-    pages: Dict[str, Entry] = dict()
+def write_shard(args: argparse.Namespace, shard: int, shards: int, plan: Tuple[List[Optional[str]], Set[str]]) -> Dict:
+    # Runs in a worker process, with its own report so that each shard's time and memory is visible
+    with instrumentation.stage("combiner_shard_{:02d}".format(shard)) as report:
+        result = write_dictionary(args, shard_path(args.o, shard, shards), report, shard, shards, plan)
+    result["wall_time"] = report.wall_time
+    result["peak_rss"] = instrumentation.peak_rss()
+    return result
+
 
-    image_set = set(filter(lambda x: ".svg" in x, os.listdir("./build/OtherResources/Images")))
+def print_english_reduction(english_bytes: Dict[str, int], entries: Dict[str, int], english_translations: int):
+    # The overflow pages hold what the English pages would have had without the cap, so their share
+    # of the total is (near enough) how much smaller the English pages are
+    total = english_bytes["pages"] + english_bytes["overflow"]
+    if not english_translations or not total:
+        return
+    print("English pages: {} bytes, {:.1%} smaller with at most {} translations each ({} words have "
+          "overflow pages, {} bytes)".format(
+              english_bytes["pages"], english_bytes["overflow"] / total, english_translations,
+              entries["english_overflow"], english_bytes["overflow"]))
 
-    pages = set([
-        *create_kanji_pages(args.kanji, image_set),
-        *create_japanese_pages(args.dictionary),
-        *create_english_pages()
-    ])
 
-    dictionary = DictionaryOutput(pages)
+def save_size_profile(path: str, profiles: List[SizeProfile]):
+    profile = profiles[0]
+    for other in profiles[1:]:
+        profile.merge(other)
+    result = profile.to_dict()
+    write_profile(path, result)
+    print(format_profile(result))
 
-    tree = ElementTree.ElementTree(dictionary.root)
-    tree.write(args.o, "UTF-8", True)
 
-    get_stats(pages)
+def main():
+    args = get_arguments()
+
+    with instrumentation.stage("combiner") as report:
+        if not args.shards:
+            result = write_dictionary(args, args.o, report)
+            get_stats(result["entries"])
+            print_english_reduction(result["english_bytes"], result["entries"], args.english_translations)
+            print("Pipeline:\n    {}".format(format_statistics(result["pipeline"])))
+            if args.size_profile:
+                save_size_profile(args.size_profile, [result["size_profile"]])
+            return
+
+        with report.phase("plan"):
+            plan = plan_japanese_pages(args.dictionary)
+
+        # Every worker reads all of the input, but only builds, renders and writes its own pages
+        with report.phase("shards", args.shards):
+            with Pool(args.workers or args.shards) as pool:
+                shards = pool.starmap(write_shard, [(args, x, args.shards, plan) for x in range(args.shards)])
+
+        write_shard_manifest(manifest_path(args.o), shards)
+
+        entries = {key: sum(x["entries"][key] for x in shards) for key in shards[0]["entries"]}
+        report.add_records(sum(entries.values()) - entries["kanji_image"])
+        report.count("output bytes", sum(x["bytes"] for x in shards))
+
+        get_stats(entries)
+        english_bytes = {key: sum(x["english_bytes"][key] for x in shards) for key in ("pages", "overflow")}
+        report.count("english page bytes", english_bytes["pages"])
+        report.count("english overflow bytes", english_bytes["overflow"])
+        print_english_reduction(english_bytes, entries, args.english_translations)
+        for shard in shards:
+            print("    {}: {} bytes in {:.1f}s, {:.1f}MB peak".format(
+                shard["path"], shard["bytes"], shard["wall_time"], shard["peak_rss"] / 2**20))
+
+        if args.size_profile:
+            save_size_profile(args.size_profile, [x["size_profile"] for x in shards])
 
 
 if __name__ == "__main__":
@@ -15,35 +15,32 @@ echo ""
 echo "A list of all indices can be seen by entering a single space in the"
 echo "search field of the Dictionary app."
 
+# ./compile_sample.sh --resume carries on from where an interrupted build stopped, keeping its output
+RESUME=""
+if [ "$1" == "--resume" ]; then
+    RESUME="--resume"
+fi
+
 echo "Setting up build directory"
 
-rm -rf build
-rm -rf output
+if [ -z "$RESUME" ]; then
+    rm -rf build
+    rm -rf output
+fi
 
-mkdir build
+mkdir -p build
 cp ./assets/Makefile_sample ./build/Makefile
 cp ./assets/info_sample.plist ./build/JapaneseDictionary.plist
 cp ./assets/style.css ./build/JapaneseDictionary.css
-mkdir build/OtherResources
+mkdir -p build/OtherResources
 cp ./assets/script.js ./build/OtherResources/script.js
 cp ./assets/prefs.html ./build/OtherResources/JapaneseDictionary_prefs.html
-mkdir build/OtherResources/Images
-tar -xzf ./assets/kanjivg.tar.xz -C ./build/OtherResources/Images
-
-mkdir output
-
-echo "Processing sample sentences"
-python3 ./sentence_converter.py ./input/sentences.csv ./input/jpn_indices.csv -o output/dictionary.db
-echo "Compiling similar Kanji"
-python3 ./kanji_relation_db.py
-echo "Processing Kanji"
-python3 ./kanjidic_converter.py ./input/kanjidic2_sample.xml
-echo "Processing Dictionary"
-python3 ./dictionary_converter.py ./input/JMdict_e_sample.xml
-echo "Compiling English entries"
-python3 ./english_entry_generator.py
-echo "Combining processed files"
-python3 ./combiner.py ./output/dictionary.xml ./output/kanji.xml ./input/english.txt -o ./build/JapaneseDictionary.xml
+mkdir -p build/OtherResources/Images
+
+mkdir -p output
+
+echo "Converting dictionary files"
+python3 ./build.py --sample $RESUME || exit 1
 
 cd build
 echo "Building dictionary (This will take a long time, i.e. 10+ minutes!)"
@@ -0,0 +1,224 @@
+import sqlite3
+import argparse
+import instrumentation
+import xml.etree.ElementTree as ElementTree
+
+from typing import Callable, Dict, List, Tuple
+
+# The kana a Godan verb's final kana changes to in each row (あ, い, え), and its て and た forms
+GODAN_ENDINGS = {
+    "う": ("わ", "い", "え", "って", "った"),
+    "く": ("か", "き", "け", "いて", "いた"),
+    "ぐ": ("が", "ぎ", "げ", "いで", "いだ"),
+    "す": ("さ", "し", "せ", "して", "した"),
+    "つ": ("た", "ち", "て", "って", "った"),
+    "ぬ": ("な", "に", "ね", "んで", "んだ"),
+    "ぶ": ("ば", "び", "べ", "んで", "んだ"),
+    "む": ("ま", "み", "め", "んで", "んだ"),
+    "る": ("ら", "り", "れ", "って", "った"),
+}
+
+Conjugations = List[Tuple[str, str]]
+
+
+def godan(word: str, ending: str, te: str = None, ta: str = None, i_row: str = None) -> Conjugations:
+    if not word.endswith(ending):
+        return []
+    stem = word[:-1]
+    a, i, e, default_te, default_ta = GODAN_ENDINGS[ending]
+    i = i_row or i
+    return [
+        ("negative", stem + a + "ない"),
+        ("negative past", stem + a + "なかった"),
+        ("past", stem + (ta or default_ta)),
+        ("te", stem + (te or default_te)),
+        ("polite", stem + i + "ます"),
+        ("potential", stem + e + "る"),
+    ]
+
+
+def ichidan(word: str) -> Conjugations:
+    if not word.endswith("る"):
+        return []
+    stem = word[:-1]
+    return [
+        ("negative", stem + "ない"),
+        ("negative past", stem + "なかった"),
+        ("past", stem + "た"),
+        ("te", stem + "て"),
+        ("polite", stem + "ます"),
+        ("potential", stem + "られる"),
+        # The colloquial ら抜き potential, e.g. 食べれる
+        ("potential", stem + "れる"),
+    ]
+
+
+def zuru(word: str) -> Conjugations:
+    # e.g. 信ずる, conjugated like 信じる
+    if not word.endswith("ずる"):
+        return []
+    return ichidan(word[:-2] + "じる")
+
+
+def kuru(word: str) -> Conjugations:
+    if word.endswith("来る"):
+        stems = {"negative": word[:-1], "other": word[:-1]}
+    elif word.endswith("くる"):
+        stems = {"negative": word[:-2] + "こ", "other": word[:-2] + "き"}
+    else:
+        return []
+    return [
+        ("negative", stems["negative"] + "ない"),
+        ("negative past", stems["negative"] + "なかった"),
+        ("past", stems["other"] + "た"),
+        ("te", stems["other"] + "て"),
+        ("polite", stems["other"] + "ます"),
+        ("potential", stems["negative"] + "られる"),
+    ]
+
+
+def suru(word: str) -> Conjugations:
+    if not word.endswith("する"):
+        return []
+    stem = word[:-2]
+    return [
+        ("negative", stem + "しない"),
+        ("negative past", stem + "しなかった"),
+        ("past", stem + "した"),
+        ("te", stem + "して"),
+        ("polite", stem + "します"),
+        ("potential", stem + "できる"),
+    ]
+
+
+def suru_noun(word: str) -> Conjugations:
+    # Nouns that take する, e.g. 勉強 -> 勉強する, 勉強した
+    return [("する", word + "する")] + suru(word + "する")
+
+
+def adjective(word: str, yoi: bool = False) -> Conjugations:
+    if not word.endswith("い"):
+        return []
+    # いい (and compounds like かっこいい) conjugate from よい, but other adjectives ending in いい
+    # (e.g. かわいい) don't
+    stem = word[:-2] + "よ" if yoi and word.endswith("いい") else word[:-1]
+    return [
+        ("negative", stem + "くない"),
+        ("negative past", stem + "くなかった"),
+        ("past", stem + "かった"),
+        ("te", stem + "くて"),
+        ("polite", word + "です"),
+    ]
+
+
+def adjectival_noun(word: str) -> Conjugations:
+    return [
+        ("negative", word + "ではない"),
+        ("negative", word + "じゃない"),
+        ("past", word + "だった"),
+        ("te", word + "で"),
+        ("polite", word + "です"),
+    ]
+
+
+# The conjugation of each part of speech class written by dictionary_converter (see
+# dictionary_converter.CLASSIFICATIONS). Classes that aren't listed aren't conjugated.
+# Godan Irregular (〜る) is ある, whose negative is ない, so only its other forms are listed.
+CONJUGATIONS: Dict[str, Callable[[str], Conjugations]] = {
+    "Godan (〜う)": lambda x: godan(x, "う"),
+    "Godan (〜く)": lambda x: godan(x, "く"),
+    "Godan (〜ぐ)": lambda x: godan(x, "ぐ"),
+    "Godan (〜す)": lambda x: godan(x, "す"),
+    "Godan (〜つ)": lambda x: godan(x, "つ"),
+    "Godan (〜ぬ)": lambda x: godan(x, "ぬ"),
+    "Godan (〜ぶ)": lambda x: godan(x, "ぶ"),
+    "Godan (〜む)": lambda x: godan(x, "む"),
+    "Godan (〜る)": lambda x: godan(x, "る"),
+    "Godan (いく・ゆく)": lambda x: godan(x, "く", te="って", ta="った"),
+    "Godan Irregular (〜う)": lambda x: godan(x, "う", te="うて", ta="うた"),
+    "Godan (〜ある)": lambda x: godan(x, "る", i_row="い"),
+    "Godan Irregular (〜る)": lambda x: [y for y in godan(x, "る") if not y[0].startswith("negative")],
+    "Verb Irregular (ぬ)": lambda x: godan(x, "ぬ"),
+    "Ichidan": ichidan,
+    "Ichidan (くれる)": ichidan,
+    "Ichidan (ずる)": zuru,
+    "Verb (くる)": kuru,
+    "Verb (する)": suru,
+    "Noun/Participle Taking する": suru_noun,
+    "Adjective": adjective,
+    "Adjective (よい)": lambda x: adjective(x, yoi=True),
+    "Adjectival Noun": adjectival_noun,
+}
+
+
+def conjugate_entry(entry: ElementTree.Element) -> List[Tuple[str, str, str, str]]:
+    # (surface, headword, form, class) rows for every written form of the entry
+    title = entry.attrib["title"]
+    classes = dict.fromkeys(x.text for x in entry.findall("definition/pos"))
+    words = dict.fromkeys([x.attrib["text"] for x in entry.findall("kanji")] +
+                          [x.attrib["text"] for x in entry.findall("reading")])
+
+    rows = {}
+    for word_class in classes:
+        if word_class not in CONJUGATIONS:
+            continue
+        for word in words:
+            for form, surface in CONJUGATIONS[word_class](word):
+                if surface not in words:
+                    rows.setdefault((surface, form), (surface, title, form, word_class))
+    return list(rows.values())
+
+
+def deinflect(db: sqlite3.Connection, surface: str) -> List[Tuple[str, str, str]]:
+    # The (headword, form, class) that a conjugated word comes from, in a single index lookup
+    return db.execute(
+        "SELECT headword, form, class FROM Deinflections WHERE surface = ?", (surface,)
+    ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dictionary", type=str, nargs="?", default="output/dictionary.xml")
+    parser.add_argument("--database", "-o", type=str, default="output/dictionary.db")
+    args = parser.parse_args()
+
+    with instrumentation.stage("deinflection_generator") as report:
+        # Other stages may be writing to the database at the same time (see build.py)
+        db = sqlite3.connect(args.database, timeout=600)
+        cursor = db.cursor()
+
+        cursor.execute("DROP TABLE IF EXISTS Deinflections")
+        cursor.execute("""
+        CREATE TABLE Deinflections (
+            surface TEXT, -- Conjugated form, e.g. 書いた
+            headword TEXT, -- Title of the entry it comes from, e.g. 書く
+            form TEXT, -- Name of the conjugation, e.g. past
+            class TEXT -- Part of speech class the conjugation follows, e.g. Godan (〜く)
+        )
+        """)
+
+        with report.phase("conjugate") as phase:
+            for _, tag in ElementTree.iterparse(args.dictionary):
+                if tag.tag != "entry":
+                    continue
+                rows = conjugate_entry(tag)
+                cursor.executemany("INSERT INTO Deinflections VALUES (?, ?, ?, ?)", rows)
+                for row in rows:
+                    report.count(row[2])
+                phase.records += len(rows)
+                tag.clear()
+
+        with report.phase("index"):
+            cursor.execute("CREATE INDEX DeinflectionSurface ON Deinflections (surface)")
+
+        with report.phase("commit"):
+            db.commit()
+            db.close()
+
+        report.add_records(report.phases["conjugate"].records)
+        print("Added {} deinflection rows ({})".format(
+            report.records, ", ".join("{} {}".format(x, y) for x, y in report.counters.items())))
+
+
+if __name__ == "__main__":
+    main()
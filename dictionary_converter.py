@@ -1,10 +1,14 @@
-import argparse
+import re
+import jaconv
 import sqlite3
+import argparse
+import instrumentation
 import xml.etree.ElementTree as ElementTree
 
 from typing import List, Tuple
 
-DB = sqlite3.connect("output/dictionary.db")
+from lookup_store import open_store, set_store_directory
+
 
 CLASSIFICATIONS = {
     "noun or verb acting prenominally": "Prenominal Noun",
@@ -63,6 +67,27 @@ CLASSIFICATIONS = {
 }
 
 
+# The priority markers of words JMdict considers common
+COMMON_PRIORITIES = {"news1", "ichi1", "spec1", "spec2", "gai1"}
+# Ranks (see priority_rank) of common words outside the frequency bands, of less common words, and
+# of words without any priority marker
+COMMON_RANK = 49
+LESS_COMMON_RANK = 50
+NO_PRIORITY_RANK = 99
+
+# Hepburn spellings of the kana with a small vowel used in loanwords, which jaconv reads as two
+# separate kana (ティ -> "tei"). Keyed by hiragana, as readings are converted before they're romanised.
+SMALL_VOWEL_DIGRAPHS = {
+    "てぃ": "ti", "でぃ": "di", "とぅ": "tu", "どぅ": "du", "てゅ": "tyu", "でゅ": "dyu",
+    "ちぇ": "che", "しぇ": "she", "じぇ": "je", "いぇ": "ye",
+    "うぃ": "wi", "うぇ": "we", "うぉ": "wo",
+    "ふぁ": "fa", "ふぃ": "fi", "ふぇ": "fe", "ふぉ": "fo", "ふゅ": "fyu",
+    "ゔぁ": "va", "ゔぃ": "vi", "ゔぇ": "ve", "ゔぉ": "vo",
+    "つぁ": "tsa", "つぃ": "tsi", "つぇ": "tse", "つぉ": "tso",
+}
+SMALL_VOWEL_DIGRAPH = re.compile("|".join(SMALL_VOWEL_DIGRAPHS))
+
+
 class Definition:
     def __init__(self, index: int, translations: List[str], pos: List[str], info: List[str]):
         # The index of the definition
@@ -83,9 +108,11 @@ class Definition:
 
 
 class Kanji:
-    def __init__(self, kanji: str, info: List[str]):
+    def __init__(self, kanji: str, info: List[str], priorities: List[str]):
         self.kanji = kanji
         self.info = [self.simplify(x) for x in info]
+        # The ke_pri markers, e.g. news1, ichi1, nf12
+        self.priorities = priorities
 
     def simplify(self, info: str) -> str:
         if info == "ateji (phonetic) reading":
@@ -100,9 +127,14 @@ class Kanji:
 
 
 class Reading:
-    def __init__(self, reading: str, info: List[str]):
+    def __init__(self, reading: str, info: List[str], priorities: List[str]):
         self.reading = reading
         self.info = [self.simplify(x) for x in info]
+        # The re_pri markers
+        self.priorities = priorities
+        # Normalised once here, so that katakana/hiragana variants and romaji can be looked up
+        # without converting at query time
+        self.hiragana, self.romaji = normalise_reading(reading)
 
     def simplify(self, info: str) -> str:
         if info == "gikun (meaning as reading) or jukujikun (special kanji reading)":
@@ -114,6 +146,61 @@ class Reading:
         raise ValueError("Unknown tag '{}'".format(info))
 
 
+def priority_rank(priorities: List[str]) -> int:
+    # A single rank for JMdict's priority markers, smaller being more common. nf01 to nf48 are the
+    # bands of 500 words in a word frequency list, and come with news1 or news2. Words marked from
+    # the other lists are ranked after the frequency bands, common ones (the "1" lists) first.
+    ranks = [NO_PRIORITY_RANK]
+    for priority in priorities:
+        if priority.startswith("nf"):
+            ranks.append(int(priority[2:]))
+        elif priority in COMMON_PRIORITIES:
+            ranks.append(COMMON_RANK)
+        else:
+            ranks.append(LESS_COMMON_RANK)
+    return min(ranks)
+
+
+def normalise_reading(reading: str) -> Tuple[str, str]:
+    hiragana = jaconv.kata2hira(reading)
+    # jaconv leaves romaji already in the reading as it is, so the digraphs, and ん before a vowel or
+    # y (きんえん -> kin'en, not kinen), are written out before the rest is converted
+    romaji = SMALL_VOWEL_DIGRAPH.sub(lambda x: SMALL_VOWEL_DIGRAPHS[x.group()], hiragana)
+    romaji = jaconv.kana2alphabet(re.sub(r"ん(?=[あいうえおやゆよ])", "n'", romaji))
+    # jaconv writes the long vowel mark as "-", spell the vowel out instead (こーひー -> koohii)
+    romaji = re.sub(r"([aeiou])-", r"\1\1", romaji)
+    return hiragana, romaji
+
+
+def write_reading_keys(db_path: str, entries: List["DictionaryEntry"]) -> int:
+    # Other stages may be writing to the database at the same time (see build.py)
+    db = sqlite3.connect(db_path, timeout=600)
+    cursor = db.cursor()
+
+    cursor.execute("DROP TABLE IF EXISTS ReadingKeys")
+    cursor.execute("""
+    CREATE TABLE ReadingKeys (
+        key TEXT, -- Normalised reading
+        kind TEXT, -- hiragana or romaji
+        reading TEXT, -- Reading as written in JMdict
+        headword TEXT -- Title of the entry
+    )
+    """)
+
+    rows = set()
+    for entry in entries:
+        for reading in entry.reading_elements:
+            rows.add((reading.hiragana, "hiragana", reading.reading, entry.title))
+            rows.add((reading.romaji, "romaji", reading.reading, entry.title))
+
+    cursor.executemany("INSERT INTO ReadingKeys VALUES (?, ?, ?, ?)", sorted(rows))
+    cursor.execute("CREATE INDEX ReadingKey ON ReadingKeys (key)")
+
+    db.commit()
+    db.close()
+    return len(rows)
+
+
 class DictionaryEntry:
     def __init__(self, jmdict_tag: ElementTree.Element):
         self.kanji_elements: List[Kanji] = []
@@ -124,6 +211,10 @@ class DictionaryEntry:
 
         self.title: str = self.get_title()
 
+        # The rank of the most common of the entry's kanji forms and readings
+        self.priority: int = priority_rank(
+            [x for element in self.kanji_elements + self.reading_elements for x in element.priorities])
+
         self.containing_kanji: List[List[str]] = self.add_containing_kanji()
 
     def get_title(self) -> str:
@@ -162,8 +253,9 @@ class DictionaryEntry:
         # Insert the kanji into the dictionary
         name = tag.find("keb").text
         info = [x.text for x in tag.findall("ke_inf")]
+        priorities = [x.text for x in tag.findall("ke_pri")]
 
-        new_kanji = Kanji(name, info)
+        new_kanji = Kanji(name, info, priorities)
         self.kanji_elements.append(new_kanji)
 
     def add_reading(self, tag: ElementTree.Element):
@@ -182,11 +274,12 @@ class DictionaryEntry:
 
         name = tag.find("reb").text
         info = [x.text for x in tag.findall("re_inf")]
+        priorities = [x.text for x in tag.findall("re_pri")]
 
         if tag.find("re_nokanji"):
             info.append("Reference Only")
 
-        new_reading = Reading(name, info)
+        new_reading = Reading(name, info, priorities)
         self.reading_elements.append(new_reading)
 
     def add_definition(self, tag: ElementTree.Element, parts_of_speech: Tuple[str]):
@@ -223,10 +316,10 @@ class DictionaryEntry:
         unique_chars = [c for c in self.title if not (c in seen_chars or seen_chars.add(c))]
 
         result = []
-        for character in unique_chars:
-                kanji = DB.execute("SELECT character, meaning FROM Kanji WHERE character=?", (character, )).fetchone()
-                if kanji:
-                    result.append(list(kanji))
+        with instrumentation.current_stage().timed("db lookups"):
+            for character in unique_chars:
+                for meaning, in open_store("kanji_meanings").get(character):
+                    result.append([character, meaning])
         return result
 
 
@@ -234,55 +327,75 @@ def append_tag(parent: ElementTree.Element, tag_name: str, text=None, attribs=No
     tag = ElementTree.SubElement(parent, tag_name)
     if text:
         tag.text = text
-    tag.attrib = attribs
+    tag.attrib = attribs or {}
     return tag
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("jmdict", type=str)
+    parser.add_argument("--database", type=str, default="output/dictionary.db")
+    parser.add_argument("--stores", type=str, default="output", help="directory of the lookup stores")
     args = parser.parse_args()
 
-    tree = ElementTree.parse(args.jmdict)
-    root = tree.getroot()
+    set_store_directory(args.stores)
 
-    entries: List[DictionaryEntry] = []
+    with instrumentation.stage("dictionary_converter") as report:
+        with report.phase("parse"):
+            tree = ElementTree.parse(args.jmdict)
+            root = tree.getroot()
 
-    for entry in root.findall("entry"):
-        entries.append(DictionaryEntry(entry))
+        entries: List[DictionaryEntry] = []
 
-    root = ElementTree.Element("dictionary")
+        with report.phase("build entries") as phase:
+            for entry in root.findall("entry"):
+                entries.append(DictionaryEntry(entry))
+            phase.records = len(entries)
 
-    for entry in entries:
-        entry_root = append_tag(root, "entry", attribs={"title": entry.title})
+        root = ElementTree.Element("dictionary")
 
-        for reading in entry.reading_elements:
-            r_tag = append_tag(entry_root, "reading", attribs={"text": reading.reading})
-            for info in reading.info:
-                append_tag(r_tag, "info", info)
-
-        for kanji in entry.kanji_elements:
-            k_tag = append_tag(entry_root, "kanji", attribs={"text": kanji.kanji})
-            for info in kanji.info:
-                append_tag(k_tag, "info", info)
+        with report.phase("render", len(entries)):
+            for entry in entries:
+                entry_root = append_tag(root, "entry", attribs={"title": entry.title, "priority": str(entry.priority)})
+
+                for reading in entry.reading_elements:
+                    r_tag = append_tag(entry_root, "reading", attribs={
+                        "text": reading.reading, "hiragana": reading.hiragana, "romaji": reading.romaji})
+                    for info in reading.info:
+                        append_tag(r_tag, "info", info)
+                    for priority in reading.priorities:
+                        append_tag(r_tag, "priority", priority)
+
+                for kanji in entry.kanji_elements:
+                    k_tag = append_tag(entry_root, "kanji", attribs={"text": kanji.kanji})
+                    for info in kanji.info:
+                        append_tag(k_tag, "info", info)
+                    for priority in kanji.priorities:
+                        append_tag(k_tag, "priority", priority)
         
-        for kanji in entry.containing_kanji:
-            ck_tag = append_tag(entry_root, "containing_kanji", attribs={"text": kanji[0], "meaning": kanji[1]})
+                for kanji in entry.containing_kanji:
+                    ck_tag = append_tag(entry_root, "containing_kanji", attribs={"text": kanji[0], "meaning": kanji[1]})
+
+                for definition in entry.definitions:
+                    d_tag = append_tag(entry_root, "definition")
+
+                    for pos in definition.part_of_speech:
+                        append_tag(d_tag, "pos", pos)
 
-        for definition in entry.definitions:
-            d_tag = append_tag(entry_root, "definition")
+                    for translation in definition.translations:
+                        append_tag(d_tag, "translation", translation)
 
-            for pos in definition.part_of_speech:
-                append_tag(d_tag, "pos", pos)
+                    for info in definition.information:
+                        append_tag(d_tag, "info", info)
 
-            for translation in definition.translations:
-                append_tag(d_tag, "translation", translation)
+        with report.phase("serialise"):
+            tree = ElementTree.ElementTree(root)
+            tree.write("output/dictionary.xml", "UTF-8", True)
 
-            for info in definition.information:
-                append_tag(d_tag, "info", info)
+        with report.phase("reading keys") as phase:
+            phase.records = write_reading_keys(args.database, entries)
 
-    tree = ElementTree.ElementTree(root)
-    tree.write("output/dictionary.xml", "UTF-8", True)
+        report.add_records(len(entries))
 
 
 if __name__ == "__main__":
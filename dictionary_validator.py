@@ -0,0 +1,150 @@
+import sys
+import argparse
+import instrumentation
+import xml.etree.ElementTree as ElementTree
+
+from typing import Dict, List, Set
+
+from shards import open_shard
+
+APPLE_NAMESPACE = "{http://www.apple.com/DTDs/DictionaryService-1.0.rng}"
+XHTML_NAMESPACE = "{http://www.w3.org/1999/xhtml}"
+
+DICTIONARY_TAG = APPLE_NAMESPACE + "dictionary"
+ENTRY_TAG = APPLE_NAMESPACE + "entry"
+INDEX_TAG = APPLE_NAMESPACE + "index"
+LINK_TAG = XHTML_NAMESPACE + "a"
+
+TITLE = APPLE_NAMESPACE + "title"
+VALUE = APPLE_NAMESPACE + "value"
+YOMI = APPLE_NAMESPACE + "yomi"
+
+# The attributes Dictionary Development Kit needs on every d:index
+REQUIRED_INDEX_ATTRIBUTES = {VALUE: "d:value", TITLE: "d:title"}
+
+# Links to another entry of the same dictionary, x-dictionary:r:<entry id>
+LINK_PREFIX = "x-dictionary:r:"
+
+# Validation stops after this many errors, there's no use listing thousands of the same mistake
+MAX_ERRORS = 20
+
+
+class TooManyErrors(Exception):
+    pass
+
+
+class Validator:
+    def __init__(self, max_errors: int = MAX_ERRORS):
+        self.max_errors = max_errors
+        self.errors: List[str] = []
+
+        # Only the ids and the targets of links are kept, the entries themselves are dropped as
+        # soon as they're checked
+        self.ids: Set[str] = set()
+        # Every link target, and the first entry linking to it
+        self.links: Dict[str, str] = {}
+
+        self.entries = 0
+        self.indexes = 0
+        self.link_count = 0
+
+    def error(self, message: str):
+        self.errors.append(message)
+        if len(self.errors) >= self.max_errors:
+            raise TooManyErrors()
+
+    def check_entry(self, path: str, entry: ElementTree.Element):
+        entry_id = entry.attrib.get("id")
+        name = entry_id or "entry {}".format(self.entries)
+
+        if not entry_id:
+            self.error("{}: {} has no id".format(path, name))
+        elif entry_id in self.ids:
+            self.error("{}: duplicate entry id {}".format(path, entry_id))
+        else:
+            self.ids.add(entry_id)
+
+        if not entry.attrib.get(TITLE):
+            self.error("{}: {} has no d:title".format(path, name))
+
+        for element in entry.iter():
+            if element.tag == INDEX_TAG:
+                self.indexes += 1
+                for attribute, attribute_name in REQUIRED_INDEX_ATTRIBUTES.items():
+                    if not element.attrib.get(attribute):
+                        self.error("{}: a d:index of {} has no {}".format(path, name, attribute_name))
+                if YOMI in element.attrib and not element.attrib[YOMI]:
+                    self.error("{}: a d:index of {} has an empty d:yomi".format(path, name))
+            elif element.tag == ENTRY_TAG and element is not entry:
+                self.error("{}: {} contains another d:entry".format(path, name))
+            elif element.tag == LINK_TAG and element.attrib.get("href", "").startswith(LINK_PREFIX):
+                self.link_count += 1
+                target = element.attrib["href"][len(LINK_PREFIX):]
+                self.links.setdefault(target, name)
+
+    def validate(self, path: str):
+        # Streams the file, clearing each entry once it's been checked
+        root = None
+        with open_shard(path) as in_file:
+            try:
+                for event, tag in ElementTree.iterparse(in_file, ("start", "end")):
+                    if root is None:
+                        root = tag
+                        if root.tag != DICTIONARY_TAG:
+                            self.error("{}: the root element is {}, not d:dictionary".format(path, root.tag))
+                    elif event == "end" and tag.tag == ENTRY_TAG:
+                        self.entries += 1
+                        self.check_entry(path, tag)
+                        root.clear()
+            except ElementTree.ParseError as error:
+                line, column = error.position
+                self.error("{}: not well-formed at line {}, column {}: {}".format(path, line, column, error))
+
+    def check_links(self):
+        # Links can point forwards, so they're only checked once every file has been read
+        for target, source in self.links.items():
+            if target not in self.ids:
+                self.error("{} links to {}, which isn't an entry".format(source, target))
+
+
+def validate(paths: List[str], max_errors: int = MAX_ERRORS) -> Validator:
+    # The paths are checked as a single dictionary, so the shards of one (see shards.py) can be given
+    validator = Validator(max_errors)
+    try:
+        for path in paths:
+            validator.validate(path)
+        validator.check_links()
+    except TooManyErrors:
+        validator.errors.append("Stopped after {} errors".format(max_errors))
+    return validator
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", type=str, nargs="*", default=["build/JapaneseDictionary.xml"],
+                        help="dictionary XML written by combiner.py, or all of its shards")
+    parser.add_argument("--max-errors", type=int, default=MAX_ERRORS)
+    args = parser.parse_args()
+
+    with instrumentation.stage("dictionary_validator") as report:
+        with report.phase("validate") as phase:
+            validator = validate(args.paths, args.max_errors)
+            phase.records += validator.entries
+
+        report.add_records(validator.entries)
+        report.count("indexes", validator.indexes)
+        report.count("links", validator.link_count)
+        report.count("errors", len(validator.errors))
+
+    for error in validator.errors:
+        print(error)
+
+    print("Checked {} entries, {} indexes and {} links: {} errors".format(
+        validator.entries, validator.indexes, validator.link_count, len(validator.errors)))
+
+    if validator.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,17 @@
 import re
 import sqlite3
-from xml.etree import ElementTree
+import instrumentation
 
-from typing import List
+from english_search import build_index
 
-db = sqlite3.connect("output/dictionary.db")
-cursor = db.cursor()
+from xml.etree import ElementTree
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS EnglishTranslations (
-    en TEXT, -- English Translation
-    explanation TEXT, -- Any further explanation of en translation i.e. "distant to speaker and listener"
-    jp TEXT, -- Japanese Word
-    context TEXT, -- Comma seperated list of other translations
-    speech_parts TEXT, -- Comma seperated list of speech parts
-    sense_index INTEGER -- Index of sense in JMDict
-)
-""")
+from typing import List
 
 
 def get_base_word(title: str) -> str:
-    return re.sub(r"\([^)]*\)", "", title)
+    # The translation without its bracketed explanations, i.e. "red (color)" is stored as "red"
+    return re.sub(r"\([^)]*\)", "", title).strip()
 
 
 def get_explanations(title: str) -> List[str]:
@@ -31,36 +22,69 @@ def get_explanations(title: str) -> List[str]:
     return [re.sub("[\(,\)]", "", x) for x in explanations]
 
 
-root = ElementTree.parse("output/dictionary.xml").getroot()
-for entry in root.findall("entry"):
-    # Add the entry title into the reverse lookup table
-    entry_title = entry.attrib["title"]
+def main():
+    with instrumentation.stage("english_entry_generator") as report:
+        # Other stages may be writing to the database at the same time (see build.py)
+        db = sqlite3.connect("output/dictionary.db", timeout=600)
+        cursor = db.cursor()
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS EnglishTranslations (
+            en TEXT, -- English Translation
+            explanation TEXT, -- Any further explanation of en translation i.e. "distant to speaker and listener"
+            jp TEXT, -- Japanese Word
+            context TEXT, -- Comma seperated list of other translations
+            speech_parts TEXT, -- Comma seperated list of speech parts
+            sense_index INTEGER, -- Index of sense in JMDict
+            priority INTEGER -- Priority rank of the Japanese word, smaller is more common (see dictionary_converter.priority_rank)
+        )
+        """)
+
+        with report.phase("parse"):
+            root = ElementTree.parse("output/dictionary.xml").getroot()
+
+        with report.phase("translations") as phase:
+            for entry in root.findall("entry"):
+                # Add the entry title into the reverse lookup table
+                entry_title = entry.attrib["title"]
+                priority = int(entry.attrib["priority"])
+
+                for index, definition_tag in enumerate(entry.findall("definition")):
+                    for translation_tag in definition_tag.findall("translation"):
+                        translation = translation_tag.text
+
+                        base = get_base_word(translation)
+
+                        # Ignore super long translation text, since these are usually explanations.
+                        # The dictionary can't have keys longer than 128 chars anyway.
+                        if len(base) > 32 or base == "":
+                            continue
+
+                        explanations = ", ".join(get_explanations(translation))
 
-    for index, definition_tag in enumerate(entry.findall("definition")):
-        for translation_tag in definition_tag.findall("translation"):
-            translation = translation_tag.text
+                        # Get the context and remove the current word from it
+                        context = [get_base_word(x.text) for x in definition_tag.findall("translation")]
+                        context.remove(base)
+                        context = ", ".join(context)
 
-            base = get_base_word(translation)
+                        parts_of_speech = ", ".join([x.text for x in definition_tag.findall("pos")])
 
-            # Ignore super long translation text, since these are usually explanations.
-            # The dictionary can't have keys longer than 128 chars anyway.
-            if len(base) > 32 or base == "":
-                continue
+                        cursor.execute(
+                            "INSERT INTO EnglishTranslations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (base, explanations, entry_title, context, parts_of_speech, index, priority)
+                        )
+                        phase.records += 1
 
-            explanations = ", ".join(get_explanations(translation))
+        with report.phase("search index"):
+            build_index(cursor)
 
-            # Get the context and remove the current word from it
-            context = [get_base_word(x.text) for x in definition_tag.findall("translation")]
-            context.remove(base)
-            context = ", ".join(context)
+        with report.phase("commit"):
+            cursor.close()
+            db.commit()
+            db.close()
 
-            parts_of_speech = ", ".join([x.text for x in definition_tag.findall("pos")])
+        report.add_records(report.phases["translations"].records)
 
-            cursor.execute(
-                "INSERT INTO EnglishTranslations VALUES (?, ?, ?, ?, ?, ?)",
-                (base, explanations, entry_title, context, parts_of_speech, index)
-            )
 
-cursor.close()
-db.commit()
-db.close()
+if __name__ == "__main__":
+    main()
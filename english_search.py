@@ -0,0 +1,106 @@
+import time
+import sqlite3
+import argparse
+
+from dataclasses import dataclass
+from typing import List
+
+# Weights of the en, explanation and context columns when ranking matches
+COLUMN_WEIGHTS = (10.0, 2.0, 1.0)
+# How much a match loses for each sense it is further down its JMdict entry. Earlier senses are
+# the more common meanings of a word.
+SENSE_WEIGHT = 0.5
+# The trigram tokenizer can't match anything shorter than a trigram
+MINIMUM_QUERY_LENGTH = 3
+
+
+@dataclass
+class SearchResult:
+    en: str
+    explanation: str
+    jp: str
+    context: str
+    speech_parts: List[str]
+    sense_index: int
+
+
+def build_index(cursor):
+    # An external content table over EnglishTranslations, so the text isn't stored twice. The
+    # trigram tokenizer matches any substring of at least three characters, and phrases as well.
+    cursor.execute("DROP TABLE IF EXISTS EnglishSearch")
+    cursor.execute("""
+    CREATE VIRTUAL TABLE EnglishSearch USING fts5(
+        en, -- English Translation
+        explanation, -- Further explanation of the translation
+        context, -- The other translations of the same sense
+        jp UNINDEXED, -- Japanese Word
+        speech_parts UNINDEXED,
+        sense_index UNINDEXED,
+        content='EnglishTranslations',
+        tokenize='trigram'
+    )
+    """)
+    cursor.execute("INSERT INTO EnglishSearch(EnglishSearch) VALUES ('rebuild')")
+
+
+def quote(text: str) -> str:
+    # Search for the text as a single phrase, rather than as FTS5 query syntax
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+class EnglishSearch:
+    def __init__(self, path: str = "output/dictionary.db"):
+        self.db = sqlite3.connect("file:{}?mode=ro".format(path), uri=True, check_same_thread=False)
+
+    def search(self, query: str, limit: int = 20, raw: bool = False) -> List[SearchResult]:
+        # Finds the translations containing the query, with exact matches first. With raw the query
+        # is passed to FTS5 as is, e.g. "red NEAR(car)".
+        query = query.strip()
+
+        if not raw and len(query) < MINIMUM_QUERY_LENGTH:
+            rows = self.db.execute("""
+                SELECT en, explanation, jp, context, speech_parts, sense_index
+                FROM EnglishTranslations WHERE en = ? ORDER BY sense_index LIMIT ?
+            """, (query, limit))
+        else:
+            rows = self.db.execute("""
+                SELECT en, explanation, jp, context, speech_parts, sense_index
+                FROM EnglishSearch WHERE EnglishSearch MATCH ?
+                ORDER BY en = ? DESC, bm25(EnglishSearch, ?, ?, ?) + ? * sense_index
+                LIMIT ?
+            """, (query if raw else quote(query), query, *COLUMN_WEIGHTS, SENSE_WEIGHT, limit))
+
+        return [
+            SearchResult(en, explanation, jp, context, speech_parts.split(", ") if speech_parts else [], sense)
+            for en, explanation, jp, context, speech_parts, sense in rows
+        ]
+
+    def close(self):
+        self.db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", type=str)
+    parser.add_argument("--database", type=str, default="output/dictionary.db")
+    parser.add_argument("--limit", "-n", type=int, default=20)
+    parser.add_argument("--raw", action="store_true", help="pass the query to FTS5 unquoted (AND, OR, NEAR, ...)")
+    args = parser.parse_args()
+
+    search = EnglishSearch(args.database)
+
+    start = time.perf_counter()
+    results = search.search(args.query, args.limit, args.raw)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        explanation = " ({})".format(result.explanation) if result.explanation else ""
+        print("{}{}: {} [{}] (sense {})".format(
+            result.en, explanation, result.jp, ", ".join(result.speech_parts), result.sense_index + 1))
+
+    print("{} results in {:.1f}ms".format(len(results), elapsed * 1000))
+    search.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import argparse
+import resource
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+# Every stage writes its report as <stage>.json into this directory, so that stages running
+# in separate processes (or at the same time) never write to the same file.
+REPORT_DIRECTORY = os.environ.get("BUILD_REPORT_DIR", "output/reports")
+
+# Set to "cprofile" to also dump a cProfile of each stage as <stage>.prof
+PROFILER = os.environ.get("BUILD_PROFILE", "")
+
+
+def peak_rss() -> int:
+    # Prefer the kernel's high water mark where available. Unlike ru_maxrss it is reset when a
+    # process is exec'd, so a stage started from a large parent (e.g. the benchmarks) doesn't
+    # report the parent's memory as its own.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # ru_maxrss is reported in bytes on macOS and in kilobytes everywhere else
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def stage_cpu_time() -> float:
+    # The CPU time of the process and of the child processes it has waited for, so that the work of
+    # a stage's worker pool (e.g. kanjivg_extractor minifying images) is counted once the pool closes
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def throughput(records: int, wall_time: float) -> float:
+    if wall_time > 0:
+        return records / wall_time
+    return 0.0
+
+
+class Phase:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.calls: int = 0
+        self.wall_time: float = 0.0
+        self.cpu_time: float = 0.0
+        self.records: int = 0
+        # Only sampled for phases that aren't inside another phase, see StageReport.phase
+        self.peak_rss: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "records": self.records,
+            "throughput": throughput(self.records, self.wall_time),
+            "peak_rss": self.peak_rss,
+        }
+
+
+class PhaseTimer:
+    # The cheaper form of StageReport.phase for work timed once per record (e.g. DB lookups or
+    # rendering a page): a plain context manager measuring only the wall and CPU time
+    __slots__ = ("phase", "records", "wall_start", "cpu_start")
+
+    def __init__(self, phase: Phase, records: int):
+        self.phase = phase
+        self.records = records
+
+    def __enter__(self) -> Phase:
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self.phase
+
+    def __exit__(self, *exception) -> bool:
+        phase = self.phase
+        phase.calls += 1
+        phase.wall_time += time.perf_counter() - self.wall_start
+        phase.cpu_time += time.process_time() - self.cpu_start
+        phase.records += self.records
+        return False
+
+
+class StageReport:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.started: str = datetime.now().isoformat(timespec="milliseconds")
+        self.records: int = 0
+        self.counters: Dict[str, int] = {}
+        # Phases are kept in the order they first ran. Entering the same phase again adds to it,
+        # which allows timing work that is spread across many small calls (e.g. DB lookups).
+        self.phases: Dict[str, Phase] = {}
+        # Anything else a stage measures, e.g. the queue occupancy of combiner's pipeline
+        self.metrics: Dict[str, Dict] = {}
+
+        # Phases currently open. Only the outermost samples the peak RSS, reading it is far slower
+        # than timing and nested phases are usually the ones run many times.
+        self._open_phases: int = 0
+
+        self._wall_start: float = time.perf_counter()
+        self._cpu_start: float = stage_cpu_time()
+        self.wall_time: float = 0.0
+        self.cpu_time: float = 0.0
+
+    @contextmanager
+    def phase(self, name: str, records: int = 0) -> Iterator[Phase]:
+        if name not in self.phases:
+            self.phases[name] = Phase(name)
+        phase = self.phases[name]
+
+        outermost = self._open_phases == 0
+        self._open_phases += 1
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield phase
+        finally:
+            phase.calls += 1
+            phase.wall_time += time.perf_counter() - wall_start
+            phase.cpu_time += time.process_time() - cpu_start
+            phase.records += records
+            self._open_phases -= 1
+            if outermost:
+                phase.peak_rss = peak_rss()
+
+    def timed(self, name: str, records: int = 0) -> PhaseTimer:
+        # Like phase, without the peak RSS, for phases entered once per record
+        if name not in self.phases:
+            self.phases[name] = Phase(name)
+        return PhaseTimer(self.phases[name], records)
+
+    def add_records(self, count: int, phase: Optional[str] = None):
+        # Records without a phase count towards the throughput of the whole stage
+        if phase is None:
+            self.records += count
+        else:
+            self.phases.setdefault(phase, Phase(phase)).records += count
+
+    def count(self, counter: str, amount: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self._wall_start
+        self.cpu_time = stage_cpu_time() - self._cpu_start
+
+    def to_dict(self) -> Dict:
+        return {
+            "stage": self.name,
+            "started": self.started,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_rss": peak_rss(),
+            "records": self.records,
+            "throughput": throughput(self.records, self.wall_time),
+            "counters": self.counters,
+            "phases": {name: phase.to_dict() for name, phase in self.phases.items()},
+            "metrics": self.metrics,
+        }
+
+
+_CURRENT: Optional[StageReport] = None
+
+
+def current_stage() -> StageReport:
+    # Code shared between stages (e.g. entry classes) reports through whichever stage is running.
+    # Outside of a stage the measurements go to a throwaway report.
+    global _CURRENT
+    if _CURRENT is None:
+        _CURRENT = StageReport("unnamed")
+    return _CURRENT
+
+
+@contextmanager
+def stage(name: str) -> Iterator[StageReport]:
+    global _CURRENT
+    report = StageReport(name)
+    _CURRENT = report
+
+    profiler = None
+    if PROFILER == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        yield report
+    finally:
+        report.finish()
+        _CURRENT = None
+
+        os.makedirs(REPORT_DIRECTORY, exist_ok=True)
+
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(REPORT_DIRECTORY, "{}.prof".format(name)))
+
+        with open(os.path.join(REPORT_DIRECTORY, "{}.json".format(name)), "w") as out_file:
+            json.dump(report.to_dict(), out_file, indent=2, ensure_ascii=False)
+
+
+def load_reports(directory: str) -> List[Dict]:
+    reports = []
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(directory, file_name)) as in_file:
+                reports.append(json.load(in_file))
+    return sorted(reports, key=lambda x: x["started"])
+
+
+def elapsed_time(reports: List[Dict]) -> float:
+    # From the start of the first stage to the end of the last, for when nothing timed the run itself
+    if not reports:
+        return 0.0
+    started = [datetime.fromisoformat(x["started"]).timestamp() for x in reports]
+    return max(x + y["wall_time"] for x, y in zip(started, reports)) - min(started)
+
+
+def write_run_report(reports: List[Dict], path: str, wall_time: Optional[float] = None):
+    # Combine the per stage reports into a single report for the run. Stages run concurrently, so the
+    # run's wall time is what the caller measured, and the time the stages took in total is separate.
+    run_report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "wall_time": elapsed_time(reports) if wall_time is None else wall_time,
+        "stage_time": sum(x["wall_time"] for x in reports),
+        "cpu_time": sum(x["cpu_time"] for x in reports),
+        "peak_rss": max((x["peak_rss"] for x in reports), default=0),
+        "stages": reports,
+    }
+    with open(path, "w") as out_file:
+        json.dump(run_report, out_file, indent=2, ensure_ascii=False)
+
+
+def format_summary(reports: List[Dict]) -> str:
+    rows = []
+    for report in reports:
+        rows.append((report["stage"], report))
+        rows += [("  " + name, phase) for name, phase in report["phases"].items()]
+
+    width = max([len(x) for x, _ in rows] + [len("stage")])
+    lines = ["{:<{}} {:>9} {:>9} {:>10} {:>10} {:>12}".format(
+        "stage", width, "wall (s)", "cpu (s)", "rss (MB)", "records", "records/s")]
+
+    for name, values in rows:
+        # Nested phases don't sample the RSS
+        rss = "-" if values["peak_rss"] is None else "{:.1f}".format(values["peak_rss"] / 2**20)
+        lines.append("{:<{}} {:>9.2f} {:>9.2f} {:>10} {:>10} {:>12.1f}".format(
+            name, width, values["wall_time"], values["cpu_time"], rss,
+            values["records"], values["throughput"]))
+
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("reports", type=str, nargs="?", default=REPORT_DIRECTORY)
+    parser.add_argument("--output", "-o", type=str)
+    args = parser.parse_args()
+
+    reports = load_reports(args.reports)
+
+    if args.output:
+        write_run_report(reports, args.output)
+
+    print(format_summary(reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,14 @@
 import csv
 import sqlite3
+import argparse
+import instrumentation
+
 from xml.etree import ElementTree
 
-db = sqlite3.connect("output/dictionary.db")
-cursor = db.cursor()
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS Kanji (
-    character TEXT PRIMARY KEY, -- root kanji character
-    meaning TEXT -- comma seperated meanings of kanji
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS Similarity (
-    root TEXT REFERENCES Kanji(character),
-    similar TEXT REFERENCES Kanji(character),
-    similarity INT
-)
-""")
-
-tree = ElementTree.parse("input/kanjidic2.xml").getroot()
-
-for character_tag in tree.findall("character"):
-    character = character_tag.find("literal").text
-
-    # Get all character meanings
-    meanings = []
-    for meaning_tag in character_tag.findall("reading_meaning/rmgroup/meaning"):
-        if meaning_tag.attrib == {}: # Indicates an english meaning
-            meanings.append(meaning_tag.text)
-    
-    if meanings != []:
-        meanings = ", ".join(meanings)
-        cursor.execute("INSERT INTO Kanji VALUES (?, ?);", (character, meanings))
-
-def add_radical_distance(csvpath: str, cursor):
+
+def add_radical_distance(csvpath: str, cursor) -> int:
+    count = 0
+
     with open(csvpath) as in_file:
         csv_reader = csv.reader(in_file.readlines(), delimiter=" ")
 
@@ -51,9 +24,66 @@ def add_radical_distance(csvpath: str, cursor):
 
             for similar_character, similarity_value in zip(similar_characters, similarity_values):
                 cursor.execute("INSERT INTO Similarity VALUES (?, ?, ?)", (primary_character, similar_character, similarity_value))
+                count += 1
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kanjidic", type=str, default="input/kanjidic2.xml")
+    parser.add_argument("--stroke-distance", type=str, default="input/stroke_distance.csv")
+    parser.add_argument("--radical-distance", type=str, default="input/radical_distance.csv")
+    args = parser.parse_args()
+
+    with instrumentation.stage("kanji_relation_db") as report:
+        # Other stages may be writing to the database at the same time (see build.py)
+        db = sqlite3.connect("output/dictionary.db", timeout=600)
+        cursor = db.cursor()
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Kanji (
+            character TEXT PRIMARY KEY, -- root kanji character
+            meaning TEXT -- comma seperated meanings of kanji
+        )
+        """)
+
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS Similarity (
+            root TEXT REFERENCES Kanji(character),
+            similar TEXT REFERENCES Kanji(character),
+            similarity INT
+        )
+        """)
+
+        with report.phase("parse"):
+            tree = ElementTree.parse(args.kanjidic).getroot()
+
+        with report.phase("kanji meanings") as phase:
+            for character_tag in tree.findall("character"):
+                character = character_tag.find("literal").text
+
+                # Get all character meanings
+                meanings = []
+                for meaning_tag in character_tag.findall("reading_meaning/rmgroup/meaning"):
+                    if meaning_tag.attrib == {}: # Indicates an english meaning
+                        meanings.append(meaning_tag.text)
+
+                if meanings != []:
+                    meanings = ", ".join(meanings)
+                    cursor.execute("INSERT INTO Kanji VALUES (?, ?);", (character, meanings))
+                    phase.records += 1
+
+        with report.phase("similarity") as phase:
+            phase.records += add_radical_distance(args.stroke_distance, cursor)
+            phase.records += add_radical_distance(args.radical_distance, cursor)
+
+        with report.phase("commit"):
+            db.commit()
+            db.close()
+
+        report.add_records(report.phases["kanji meanings"].records + report.phases["similarity"].records)
 
-add_radical_distance("input/stroke_distance.csv", cursor)
-add_radical_distance("input/radical_distance.csv", cursor)
 
-db.commit()
-db.close()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
-import sqlite3
 import argparse
+import instrumentation
 import xml.etree.ElementTree as ElementTree
 
 from typing import List
 from dataclasses import dataclass
 
-similar_db = sqlite3.connect("output/dictionary.db")
+from lookup_store import open_store, set_store_directory
+
 
 @dataclass
 class Reading:
@@ -112,71 +113,80 @@ class KanjiEntry:
                 self.utf8_codepoint = codepoint.text
                 break
 
-        global similar_db
-        cursor = similar_db.cursor()
-        search = cursor.execute("SELECT similar, meaning FROM Similarity JOIN Kanji ON (similar=character) WHERE root=? AND similarity > 0.7", (self.page_title, ))
-        results = search.fetchall()
-        for result in results:
-            self.similar_kanji.append(result)
+        with instrumentation.current_stage().timed("db lookups"):
+            for result in open_store("similar_kanji").get(self.page_title):
+                self.similar_kanji.append(result)
 
 def append_tag(parent: ElementTree.Element, tag_name: str, text=None, attr=None) -> ElementTree.Element:
     tag = ElementTree.SubElement(parent, tag_name)
     if text:
         tag.text = text
-    tag.attrib = attr
+    tag.attrib = attr or {}
     return tag
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("kanjidic2", type=str)
+    parser.add_argument("--stores", type=str, default="output", help="directory of the lookup stores")
     args = parser.parse_args()
 
-    tree = ElementTree.parse(args.kanjidic2)
-    root = tree.getroot()
+    set_store_directory(args.stores)
+
+    with instrumentation.stage("kanjidic_converter") as report:
+        with report.phase("parse"):
+            tree = ElementTree.parse(args.kanjidic2)
+            root = tree.getroot()
 
-    entries: List[KanjiEntry] = []
+        entries: List[KanjiEntry] = []
 
-    for character in root.findall("character"):
-        entries.append(KanjiEntry(character))
+        with report.phase("build entries") as phase:
+            for character in root.findall("character"):
+                entries.append(KanjiEntry(character))
+            phase.records = len(entries)
 
-    root = ElementTree.Element("dictionary")
+        root = ElementTree.Element("dictionary")
 
-    for entry in entries:
-        if entry.is_worth_outputting():
-            kvg_name = "{:05x}.svg".format(int(entry.utf8_codepoint, base=16))
+        with report.phase("render") as phase:
+            for entry in entries:
+                if entry.is_worth_outputting():
+                    kvg_name = "{:05x}.svg".format(int(entry.utf8_codepoint, base=16))
 
-            attribs = {
-                "title": entry.page_title,
-                "image": kvg_name
-            }
+                    attribs = {
+                        "title": entry.page_title,
+                        "image": kvg_name
+                    }
 
-            entry_root = ElementTree.Element("entry", attribs)
+                    entry_root = ElementTree.Element("entry", attribs)
 
-            for radical in entry.radicals:
-                append_tag(entry_root, "radical", attr={"id": radical})
+                    for radical in entry.radicals:
+                        append_tag(entry_root, "radical", attr={"id": radical})
 
-            for reading in entry.on_yomi:
-                append_tag(entry_root, "reading", attr={"type": "on", "text": reading})
+                    for reading in entry.on_yomi:
+                        append_tag(entry_root, "reading", attr={"type": "on", "text": reading})
 
-            for reading in entry.kun_yomi:
-                append_tag(entry_root, "reading", attr={"type": "kun", "text": reading})
+                    for reading in entry.kun_yomi:
+                        append_tag(entry_root, "reading", attr={"type": "kun", "text": reading})
 
-            for reading in entry.nanori:
-                append_tag(entry_root, "reading", attr={"type": "nanori", "text": reading})
+                    for reading in entry.nanori:
+                        append_tag(entry_root, "reading", attr={"type": "nanori", "text": reading})
             
-            for similar in entry.similar_kanji:
-                append_tag(entry_root, "similar_kanji", attr={"kanji": similar[0], "meaning": similar[1]})
+                    for similar in entry.similar_kanji:
+                        append_tag(entry_root, "similar_kanji", attr={"kanji": similar[0], "meaning": similar[1]})
+
+                    for definition_group in entry.definitions:
+                        sense = ElementTree.SubElement(entry_root, "sense")
+                        for word in definition_group.translations:
+                            append_tag(sense, "translation", attr={"text": word})
 
-            for definition_group in entry.definitions:
-                sense = ElementTree.SubElement(entry_root, "sense")
-                for word in definition_group.translations:
-                    append_tag(sense, "translation", attr={"text": word})
+                    root.append(entry_root)
+                    phase.records += 1
 
-            root.append(entry_root)
+        with report.phase("serialise"):
+            tree = ElementTree.ElementTree(root)
+            tree.write("output/kanji.xml", "UTF-8", True)
 
-    tree = ElementTree.ElementTree(root)
-    tree.write("output/kanji.xml", "UTF-8", True)
+        report.add_records(len(entries))
 
 
 if __name__ == "__main__":
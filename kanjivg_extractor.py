@@ -0,0 +1,106 @@
+import os
+import re
+import tarfile
+import argparse
+import instrumentation
+import xml.etree.ElementTree as ElementTree
+
+from multiprocessing import Pool
+from typing import Iterator, Set, Tuple
+
+COMMENT = re.compile(rb"<!--.*?-->", re.DOTALL)
+# KanjiVG's copyright and CC BY-SA licence header, which has to stay with every image redistributed
+LICENCE_MARKER = b"Copyright"
+DOCTYPE = re.compile(rb"<!DOCTYPE[^\[>]*(\[.*?\])?\s*>", re.DOTALL)
+# KanjiVG's own attributes (kvg:element, kvg:type, ...) describe the kanji's structure, and
+# aren't needed to draw it. They are declared by the DOCTYPE, so both have to go together.
+KVG_ATTRIBUTE = re.compile(rb"\s+kvg:[\w-]+=\"[^\"]*\"")
+BLANKS = re.compile(rb">\s+<")
+
+
+def read_image_names(kanji_path: str) -> Set[str]:
+    # The images that kanjidic_converter links each kanji page to
+    result = set()
+    for _, tag in ElementTree.iterparse(kanji_path):
+        if tag.tag == "entry":
+            result.add(tag.attrib["image"])
+            tag.clear()
+    return result
+
+
+def minify_svg(image: Tuple[str, bytes]) -> Tuple[str, bytes]:
+    name, data = image
+    data = COMMENT.sub(lambda x: x.group() if LICENCE_MARKER in x.group() else b"", data)
+    data = DOCTYPE.sub(b"", data)
+    data = KVG_ATTRIBUTE.sub(b"", data)
+    data = BLANKS.sub(b"><", data)
+    return name, data.strip() + b"\n"
+
+
+def read_archive(archive_path: str, names: Set[str]) -> Iterator[Tuple[str, bytes]]:
+    # Stream through the archive once ("r|*" never seeks), only reading the wanted members
+    with tarfile.open(archive_path, "r|*") as archive:
+        for member in archive:
+            name = os.path.basename(member.name)
+            if member.isfile() and name in names:
+                yield name, archive.extractfile(member).read()
+
+
+def extract_images(archive_path: str, names: Set[str], destination: str,
+                   minify: bool = False, workers: int = None) -> Set[str]:
+    report = instrumentation.current_stage()
+    os.makedirs(destination, exist_ok=True)
+
+    result = set()
+
+    def write(images: Iterator[Tuple[str, bytes]]):
+        for name, data in images:
+            with open(os.path.join(destination, name), "wb") as out_file:
+                out_file.write(data)
+            result.add(name)
+            report.count("image bytes", len(data))
+
+    with report.phase("extract"):
+        if minify:
+            # Decompressing the archive is sequential, but the images are minified in parallel
+            with Pool(workers) as pool:
+                write(pool.imap_unordered(minify_svg, read_archive(archive_path, names), chunksize=64))
+        else:
+            write(read_archive(archive_path, names))
+
+    return result
+
+
+def write_manifest(path: str, images: Set[str]):
+    with open(path, "w") as out_file:
+        out_file.write("\n".join(sorted(images)))
+
+
+def read_manifest(path: str) -> Set[str]:
+    with open(path) as in_file:
+        return set(filter(None, in_file.read().split("\n")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("archive", type=str)
+    parser.add_argument("kanji", type=str)
+    parser.add_argument("destination", type=str)
+    parser.add_argument("--manifest", "-o", type=str, default="output/kanji_images.txt")
+    parser.add_argument("--minify", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with instrumentation.stage("kanjivg_extractor") as report:
+        with report.phase("read kanji"):
+            names = read_image_names(args.kanji)
+
+        images = extract_images(args.archive, names, args.destination, args.minify, args.workers)
+        write_manifest(args.manifest, images)
+
+        report.add_records(len(images))
+        print("Extracted {} of {} stroke order images".format(len(images), len(names)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import time
+import random
+import asyncio
+import argparse
+
+from typing import Dict, List
+from urllib.parse import quote, urlsplit
+
+from lookup_service import Dictionary, route
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    # Nearest rank percentile of already sorted values
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def create_requests(dictionary: Dictionary, count: int, seed: int) -> List[str]:
+    # A mix of lookups of every type. Real lookups are skewed towards a few common words, so the
+    # keys are picked with Zipf-like weights, which is also what makes an LRU cache worthwhile.
+    generator = random.Random(seed)
+    english = [x for x, in dictionary.db.execute("SELECT DISTINCT en FROM EnglishTranslations")]
+    keys = [
+        *(("japanese", x) for x in dictionary.japanese_index),
+        *(("kanji", x) for x in dictionary.kanji_entries),
+        *(("english", x) for x in english),
+    ]
+    generator.shuffle(keys)
+    weights = [1 / (x + 1) for x in range(len(keys))]
+
+    return ["/{}/{}".format(kind, quote(key)) for kind, key in generator.choices(keys, weights, k=count)]
+
+
+def run_library(dictionary: Dictionary, requests: List[str]) -> List[float]:
+    latencies = []
+    for target in requests:
+        start = time.perf_counter()
+        route(dictionary, target)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_client(host: str, port: int, requests: List[str], latencies: List[float]):
+    reader, writer = await asyncio.open_connection(host, port)
+    for target in requests:
+        start = time.perf_counter()
+        writer.write("GET {} HTTP/1.1\r\nHost: {}\r\n\r\n".format(target, host).encode("latin-1"))
+        await writer.drain()
+
+        length = 0
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        await reader.readexactly(length)
+
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def run_http(url: str, requests: List[str], concurrency: int) -> List[float]:
+    address = urlsplit(url)
+    latencies: List[float] = []
+    # Each client sends its share of the requests one after another over a single connection
+    await asyncio.gather(*(
+        run_client(address.hostname, address.port or 80, requests[x::concurrency], latencies)
+        for x in range(concurrency)
+    ))
+    return latencies
+
+
+def summarise(latencies: List[float], wall_time: float) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / wall_time if wall_time > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", type=str, default="output", help="directory of the converted dictionary")
+    parser.add_argument("--url", type=str, help="load test a running lookup_service.py instead of the library")
+    parser.add_argument("--requests", "-n", type=int, default=10000)
+    parser.add_argument("--concurrency", "-c", type=int, default=8, help="connections to open with --url")
+    parser.add_argument("--cache-size", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dictionary = Dictionary(args.directory, args.cache_size)
+    requests = create_requests(dictionary, args.requests, args.seed)
+
+    start = time.perf_counter()
+    if args.url:
+        latencies = asyncio.run(run_http(args.url, requests, args.concurrency))
+    else:
+        latencies = run_library(dictionary, requests)
+    wall_time = time.perf_counter() - start
+
+    result = summarise(latencies, wall_time)
+    print("{} requests in {:.2f}s ({:.0f} requests/s)".format(result["requests"], wall_time, result["throughput"]))
+    print("latency p50 {:.2f}ms, p99 {:.2f}ms, max {:.2f}ms".format(
+        result["p50"] * 1000, result["p99"] * 1000, result["max"] * 1000))
+
+    if not args.url:
+        for name, info in dictionary.cache_info().items():
+            lookups = info["hits"] + info["misses"]
+            if lookups:
+                print("{} cache: {:.0%} hits ({} entries)".format(name, info["hits"] / lookups, info["currsize"]))
+
+    dictionary.close()
+
+
+if __name__ == "__main__":
+    main()
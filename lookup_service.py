@@ -0,0 +1,232 @@
+import os
+import json
+import sqlite3
+import asyncio
+import argparse
+import xml.etree.ElementTree as ElementTree
+
+from dataclasses import asdict, is_dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from DictionaryEntry import Entry, JapaneseEntry, KanjiEntry
+from combiner import create_english_page, read_entries
+from deinflection_generator import deinflect
+from english_search import EnglishSearch
+from kanjivg_extractor import read_manifest
+from lookup_store import set_store_directory
+
+
+def to_json(value):
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, list):
+        return [to_json(x) for x in value]
+    return value
+
+
+def entry_fields(entry: Entry) -> Dict:
+    # The same fields the page templates are rendered from
+    result = {"type": type(entry).__name__}
+    result.update({key: to_json(value) for key, value in vars(entry).items()})
+    return result
+
+
+class Dictionary:
+    def __init__(self, directory: str = "output", cache_size: int = 4096):
+        # Only the serialised entries and the indexes into them are kept in memory. The entry objects
+        # (which also need the example sentences) are built when they are first looked up, and the
+        # most recently used ones are kept in an LRU cache.
+        # The example sentences are read from the stores of the same directory
+        set_store_directory(directory)
+        self.entries: List[bytes] = []
+        self.japanese_index: Dict[str, List[int]] = {}
+        for entry in read_entries(os.path.join(directory, "dictionary.xml")):
+            keys = [entry.attrib["title"]]
+            keys += [x.attrib["text"] for x in entry.findall("reading")]
+            keys += [x.attrib["text"] for x in entry.findall("kanji")]
+            # The normalised readings written by dictionary_converter
+            keys += [x.attrib[y] for x in entry.findall("reading") for y in ("hiragana", "romaji") if y in x.attrib]
+            for key in dict.fromkeys(keys):
+                self.japanese_index.setdefault(key, []).append(len(self.entries))
+            self.entries.append(ElementTree.tostring(entry))
+
+        self.kanji_entries: Dict[str, bytes] = {}
+        for entry in read_entries(os.path.join(directory, "kanji.xml")):
+            self.kanji_entries[entry.attrib["title"]] = ElementTree.tostring(entry)
+
+        manifest = os.path.join(directory, "kanji_images.txt")
+        self.image_set = read_manifest(manifest) if os.path.exists(manifest) else set()
+
+        database = os.path.join(directory, "dictionary.db")
+        self.db = sqlite3.connect("file:{}?mode=ro".format(database), uri=True, check_same_thread=False)
+        self.english_search = EnglishSearch(database)
+        self.has_deinflections = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Deinflections'").fetchone() is not None
+
+        self._japanese_entry = lru_cache(cache_size)(self._load_japanese_entry)
+        self._kanji_entry = lru_cache(cache_size)(self._load_kanji_entry)
+        self._english_entry = lru_cache(cache_size)(self._load_english_entry)
+
+    def _load_japanese_entry(self, index: int) -> Optional[Dict]:
+        entry = JapaneseEntry(ElementTree.fromstring(self.entries[index]))
+        # Entries without definitions aren't added to the dictionary either (see combiner.py)
+        if not entry.is_worth_adding():
+            return None
+        return entry_fields(entry)
+
+    def _load_kanji_entry(self, character: str) -> Optional[Dict]:
+        if character not in self.kanji_entries:
+            return None
+        return entry_fields(KanjiEntry(ElementTree.fromstring(self.kanji_entries[character]), self.image_set))
+
+    def _load_english_entry(self, word: str) -> Optional[Dict]:
+        # Every translation, ranked like the English pages (see combiner.read_english_translations)
+        rows = self.db.execute("""
+            SELECT en, explanation, jp, context, speech_parts, sense_index FROM EnglishTranslations
+            WHERE en = ? ORDER BY priority, sense_index, rowid
+        """, (word,)).fetchall()
+        if not rows:
+            return None
+        return entry_fields(create_english_page(word, rows))
+
+    def japanese(self, word: str) -> List[Dict]:
+        # Matches headwords, readings (also in hiragana and romaji) and kanji forms, or failing that the entries that a conjugated
+        # word (e.g. 書いた) comes from
+        indexes = self.japanese_index.get(word, [])
+        if not indexes and self.has_deinflections:
+            headwords = dict.fromkeys(headword for headword, _, _ in deinflect(self.db, word))
+            indexes = [x for headword in headwords for x in self.japanese_index.get(headword, [])]
+            indexes = list(dict.fromkeys(indexes))
+
+        result = [self._japanese_entry(x) for x in indexes]
+        return [x for x in result if x is not None]
+
+    def kanji(self, character: str) -> Optional[Dict]:
+        return self._kanji_entry(character)
+
+    def english(self, word: str) -> Optional[Dict]:
+        return self._english_entry(word)
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        return [asdict(x) for x in self.english_search.search(query, limit)]
+
+    def cache_info(self) -> Dict[str, Dict]:
+        caches = {"japanese": self._japanese_entry, "kanji": self._kanji_entry, "english": self._english_entry}
+        return {name: cache.cache_info()._asdict() for name, cache in caches.items()}
+
+    def close(self):
+        self.db.close()
+        self.english_search.close()
+
+
+# The number of search results returned when the limit parameter isn't given, and the most it can ask for
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+def route(dictionary: Dictionary, target: str) -> Tuple[int, object]:
+    url = urlsplit(target)
+    parts = [unquote(x) for x in url.path.split("/") if x]
+
+    if len(parts) == 2 and parts[0] == "japanese":
+        result = dictionary.japanese(parts[1])
+    elif len(parts) == 2 and parts[0] == "kanji":
+        result = dictionary.kanji(parts[1])
+    elif len(parts) == 2 and parts[0] == "english":
+        result = dictionary.english(parts[1])
+    elif parts == ["search"]:
+        query = parse_qs(url.query)
+        if "q" not in query:
+            return 400, {"error": "missing q parameter"}
+        try:
+            limit = int(query.get("limit", [str(DEFAULT_SEARCH_LIMIT)])[0])
+        except ValueError:
+            return 400, {"error": "limit must be a positive integer"}
+        # SQLite treats a negative LIMIT as no limit at all
+        if limit < 1:
+            return 400, {"error": "limit must be a positive integer"}
+        result = dictionary.search(query["q"][0], min(limit, MAX_SEARCH_LIMIT))
+    elif parts == ["stats"]:
+        result = dictionary.cache_info()
+    else:
+        return 404, {"error": "unknown path"}
+
+    if result is None or result == []:
+        return 404, {"error": "not found"}
+    return 200, result
+
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+async def handle_connection(dictionary: Dictionary, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # A minimal HTTP/1.1 server: GET requests only, with keep-alive so that clients don't pay for a
+    # new connection on every lookup
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+
+            keep_alive = True
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                if name.strip().lower() == "connection" and value.strip().lower() == "close":
+                    keep_alive = False
+
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            if method != "GET":
+                status, result = 405, {"error": "only GET is supported"}
+            else:
+                try:
+                    status, result = route(dictionary, target)
+                except Exception as error:
+                    status, result = 500, {"error": str(error)}
+
+            body = json.dumps(result, ensure_ascii=False).encode("UTF-8")
+            writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: {}\r\n{}\r\n".format(
+                status, STATUS_TEXT[status], len(body), "" if keep_alive else "Connection: close\r\n").encode("latin-1"))
+            writer.write(body)
+            await writer.drain()
+
+            if not keep_alive:
+                break
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(dictionary: Dictionary, host: str, port: int):
+    server = await asyncio.start_server(lambda r, w: handle_connection(dictionary, r, w), host, port)
+    print("Serving lookups on http://{}:{}".format(host, port))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--directory", type=str, default="output", help="directory of the converted dictionary")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache-size", type=int, default=4096, help="entries of each type kept in the LRU cache")
+    args = parser.parse_args()
+
+    dictionary = Dictionary(args.directory, args.cache_size)
+    print("Loaded {} Japanese entries and {} kanji".format(len(dictionary.entries), len(dictionary.kanji_entries)))
+
+    try:
+        asyncio.run(serve(dictionary, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dictionary.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import mmap
+import sqlite3
+import argparse
+import instrumentation
+
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+# Layout of a store file (all integers are native unsigned 32 bit):
+#   header          magic, version, key count, key blob length
+#   key offsets     key_count + 1 offsets into the key blob
+#   record offsets  key_count + 1 offsets into the record blob
+#   key blob        UTF-8 keys, sorted by their encoded bytes
+#   record blob     UTF-8 records, fields separated by FIELD_SEPARATOR and
+#                   records separated by RECORD_SEPARATOR
+MAGIC = 0x534c444a  # "JDLS"
+VERSION = 1
+HEADER_LENGTH = 16
+
+FIELD_SEPARATOR = "\x1f"
+RECORD_SEPARATOR = "\x1e"
+
+# The stores exported from output/dictionary.db, and the queries used to fill them. Each
+# query returns the key as the first column followed by the record fields, in the order
+# that the records should be returned in.
+EXPORTS = {
+    "kanji_meanings": "SELECT character, meaning FROM Kanji",
+    "similar_kanji": """
+        SELECT root, similar, meaning FROM Similarity JOIN Kanji ON (similar=character)
+        WHERE similarity > 0.7 ORDER BY Similarity.rowid
+    """,
+    "sentences": """
+        SELECT word, en, jp FROM SentenceWords JOIN Sentences ON (SentenceWords.id = Sentences.id)
+        WHERE rank IS NOT NULL ORDER BY rank
+    """,
+}
+
+
+def store_path(directory: str, name: str) -> str:
+    return "{}/{}.store".format(directory, name)
+
+
+# Where open_store finds the stores, and the stores opened so far
+_STORE_DIRECTORY = "output"
+_OPEN_STORES: Dict[str, "LookupStore"] = {}
+
+
+def set_store_directory(directory: str):
+    # Called by the stages (and the lookup service) before any lookups, with the directory given on
+    # their command line. Stores opened from the previous directory are closed.
+    global _STORE_DIRECTORY
+    for store in _OPEN_STORES.values():
+        store.close()
+    _OPEN_STORES.clear()
+    _STORE_DIRECTORY = directory
+
+
+def open_store(name: str) -> "LookupStore":
+    # The stores are opened on their first lookup rather than on import, so that the modules using
+    # them can be imported before the stores are exported
+    store = _OPEN_STORES.get(name)
+    if store is None:
+        store = _OPEN_STORES[name] = LookupStore(store_path(_STORE_DIRECTORY, name))
+    return store
+
+
+def stage_name(stores: List[str]) -> str:
+    # Exporting a subset of the stores reports as a separate stage, so that the exports can run
+    # as soon as their own tables are ready
+    if list(stores) == list(EXPORTS):
+        return "lookup_store"
+    return "lookup_store_{}".format("_".join(stores))
+
+
+class LookupStore:
+    def __init__(self, path: str):
+        with open(path, "rb") as in_file:
+            # Map the file read only so that every process using the store shares the same pages
+            self.map = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.view = memoryview(self.map)
+
+        magic, version, self.key_count, key_blob_length = self.view[:HEADER_LENGTH].cast("I")
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} lookup store".format(path, VERSION))
+
+        offsets_end = HEADER_LENGTH + 8 * (self.key_count + 1)
+        offsets = self.view[HEADER_LENGTH:offsets_end].cast("I")
+
+        self.key_offsets = offsets[:self.key_count + 1]
+        self.record_offsets = offsets[self.key_count + 1:]
+
+        self.key_blob_start = offsets_end
+        self.record_blob_start = offsets_end + key_blob_length
+
+    def __len__(self) -> int:
+        return self.key_count
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key) != -1
+
+    def _key_bytes(self, index: int) -> bytes:
+        start = self.key_blob_start + self.key_offsets[index]
+        end = self.key_blob_start + self.key_offsets[index + 1]
+        return self.map[start:end]
+
+    def _find(self, key: str) -> int:
+        encoded = key.encode("UTF-8")
+
+        # Binary search the sorted keys, only decoding the keys that are visited
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_bytes(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.key_count and self._key_bytes(low) == encoded:
+            return low
+        return -1
+
+    def get(self, key: str) -> List[Tuple[str, ...]]:
+        index = self._find(key)
+
+        if index == -1:
+            return []
+
+        start = self.record_blob_start + self.record_offsets[index]
+        end = self.record_blob_start + self.record_offsets[index + 1]
+        records = self.map[start:end].decode("UTF-8").split(RECORD_SEPARATOR)
+
+        return [tuple(record.split(FIELD_SEPARATOR)) for record in records]
+
+    def keys(self) -> Iterator[str]:
+        for index in range(self.key_count):
+            yield self._key_bytes(index).decode("UTF-8")
+
+    def close(self):
+        self.key_offsets.release()
+        self.record_offsets.release()
+        self.view.release()
+        self.map.close()
+
+
+def write_store(path: str, records: Dict[str, List[Tuple[str, ...]]]):
+    keys = sorted(records, key=lambda x: x.encode("UTF-8"))
+
+    key_offsets = array("I", [0])
+    record_offsets = array("I", [0])
+    key_blob = bytearray()
+    record_blob = bytearray()
+
+    for key in keys:
+        key_blob += key.encode("UTF-8")
+        key_offsets.append(len(key_blob))
+
+        fields = [FIELD_SEPARATOR.join(x or "" for x in record) for record in records[key]]
+        record_blob += RECORD_SEPARATOR.join(fields).encode("UTF-8")
+        record_offsets.append(len(record_blob))
+
+    header = array("I", [MAGIC, VERSION, len(keys), len(key_blob)])
+
+    with open(path, "wb") as out_file:
+        out_file.write(header.tobytes())
+        out_file.write(key_offsets.tobytes())
+        out_file.write(record_offsets.tobytes())
+        out_file.write(key_blob)
+        out_file.write(record_blob)
+
+
+def export_query(db: sqlite3.Connection, query: str, path: str) -> int:
+    records: Dict[str, List[Tuple[str, ...]]] = {}
+
+    for key, *fields in db.execute(query):
+        records.setdefault(key, []).append(tuple(fields))
+
+    write_store(path, records)
+
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("database", type=str)
+    parser.add_argument("--output", "-o", type=str, default="output")
+    parser.add_argument("--stores", type=str, nargs="+", choices=list(EXPORTS), default=list(EXPORTS))
+    args = parser.parse_args()
+
+    with instrumentation.stage(stage_name(args.stores)) as report:
+        # Other stages may be writing to the database at the same time (see build.py)
+        db = sqlite3.connect(args.database, timeout=600)
+
+        for name in args.stores:
+            with report.phase(name) as phase:
+                phase.records = export_query(db, EXPORTS[name], store_path(args.output, name))
+            report.add_records(phase.records)
+            print("Exported {} keys to the {} store".format(phase.records, name))
+
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import queue
+import threading
+import time
+
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Marks the end of the items in a queue
+DONE = object()
+
+
+class PipelineStopped(Exception):
+    # Raised inside the pipeline's threads when another thread has failed
+    pass
+
+
+class MonitoredQueue:
+    def __init__(self, name: str, maxsize: int):
+        self.name: str = name
+        self.maxsize: int = maxsize
+        self.queue: queue.Queue = queue.Queue(maxsize)
+
+        # The occupancy is sampled every time an item is added or removed
+        self.samples: int = 0
+        self.total_occupancy: int = 0
+        self.peak_occupancy: int = 0
+
+        # Time spent blocked on a full queue (the consumer is too slow) or on an empty one
+        # (the producer is too slow)
+        self.put_wait: float = 0.0
+        self.get_wait: float = 0.0
+
+    def _sample(self):
+        size = self.queue.qsize()
+        self.samples += 1
+        self.total_occupancy += size
+        self.peak_occupancy = max(self.peak_occupancy, size)
+
+    def put(self, item: Any, stop: threading.Event):
+        if stop.is_set():
+            raise PipelineStopped()
+
+        start = time.perf_counter()
+        while True:
+            try:
+                # Wake up now and then to check whether the pipeline has been stopped
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if stop.is_set():
+                    raise PipelineStopped()
+        self.put_wait += time.perf_counter() - start
+        self._sample()
+
+    def get(self, stop: threading.Event) -> Any:
+        if stop.is_set():
+            raise PipelineStopped()
+
+        start = time.perf_counter()
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if stop.is_set():
+                    raise PipelineStopped()
+        self.get_wait += time.perf_counter() - start
+        self._sample()
+        return item
+
+    def statistics(self) -> Dict:
+        mean = self.total_occupancy / self.samples if self.samples else 0.0
+        return {
+            "maxsize": self.maxsize,
+            "mean_occupancy": mean,
+            "mean_fill": mean / self.maxsize,
+            "peak_occupancy": self.peak_occupancy,
+            "put_wait": self.put_wait,
+            "get_wait": self.get_wait,
+        }
+
+
+def run_pipeline(source: Iterable, transform: Callable[[Any], Optional[Any]], sink: Callable[[Any], None],
+                 maxsize: int = 256) -> Dict[str, Dict]:
+    # Overlaps reading, transforming and writing. A reader thread iterates over the source, the
+    # calling thread transforms each item (dropping it if the transform returns None) and a writer
+    # thread passes the results to the sink, all in the original order. The queues between them
+    # are bounded, so a slow step blocks the one before it instead of letting items pile up.
+    #
+    # Returns the occupancy statistics of both queues. A queue that is usually full sits in front
+    # of the bottleneck, a queue that is usually empty behind it.
+    stop = threading.Event()
+    inputs = MonitoredQueue("read", maxsize)
+    outputs = MonitoredQueue("write", maxsize)
+    errors = []
+
+    def read():
+        try:
+            for item in source:
+                inputs.put(item, stop)
+            inputs.put(DONE, stop)
+        except PipelineStopped:
+            pass
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+
+    def write():
+        try:
+            while True:
+                item = outputs.get(stop)
+                if item is DONE:
+                    break
+                sink(item)
+        except PipelineStopped:
+            pass
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+
+    threads = [
+        threading.Thread(target=read, name="pipeline-read", daemon=True),
+        threading.Thread(target=write, name="pipeline-write", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = inputs.get(stop)
+            if item is DONE:
+                break
+            result = transform(item)
+            if result is not None:
+                outputs.put(result, stop)
+        outputs.put(DONE, stop)
+    except PipelineStopped:
+        pass
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return {x.name: x.statistics() for x in (inputs, outputs)}
+
+
+def bottleneck(statistics: Dict[str, Dict]) -> str:
+    # The slowest step is the one whose input queue fills up while its output queue doesn't
+    if statistics["write"]["mean_fill"] >= 0.5:
+        return "write"
+    if statistics["read"]["mean_fill"] >= 0.5:
+        return "transform"
+    return "read"
+
+
+def format_statistics(statistics: Dict[str, Dict]) -> str:
+    lines = []
+    for name, values in statistics.items():
+        lines.append("{} queue: {:.0%} full on average (peak {}/{}), producer blocked {:.1f}s, consumer waited {:.1f}s".format(
+            name, values["mean_fill"], values["peak_occupancy"], values["maxsize"],
+            values["put_wait"], values["get_wait"]))
+    lines.append("bottleneck: {}".format(bottleneck(statistics)))
+    return "\n    ".join(lines)
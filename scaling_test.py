@@ -0,0 +1,160 @@
+import sys
+import json
+import math
+import argparse
+
+from typing import Dict, List, Optional, Tuple
+
+import benchmark
+
+# Peak RSS allowed for each stage, in bytes. The README promises the full build fits in ~6GB.
+DEFAULT_BUDGET = 6 * 2**30
+BUDGETS: Dict[str, int] = {
+    "lookup_store_kanji_meanings_similar_kanji": 1 * 2**30,
+    "lookup_store_sentences": 2 * 2**30,
+    "kanji_relation_db": 1 * 2**30,
+}
+
+# The real downloads are roughly this many times the size of the samples (see synthetic_inputs).
+# Projections this far out are rough, so they are only enforced with --check-projection.
+FULL_SCALE = 30000
+
+# Growth exponents above this are treated as super-linear. Perfectly linear growth fits to 1.0,
+# quadratic growth to 2.0, so this leaves room for measurement noise, n*log(n) behaviour and the
+# larger inputs no longer fitting in the CPU caches, which put linear stages anywhere up to ~1.3.
+MAX_EXPONENT = 1.5
+
+# Growth is only fitted once it clearly exceeds the measurement noise of the smallest run
+MIN_GROWTH = {"cpu_time": 0.1, "peak_rss": 2**20}
+
+# Stages taking less CPU time than this at the largest scale are too quick for their growth to be
+# told apart from noise, so only their memory is checked
+MIN_TIME = 0.5
+
+# The growth of CPU time is fitted rather than of wall time, which depends more on whatever else the
+# machine is doing
+METRICS = ("cpu_time", "peak_rss")
+
+
+def fit_power_law(sizes: List[float], values: List[float]) -> Optional[Tuple[float, float]]:
+    # Least squares fit of log(value) = log(coefficient) + exponent * log(size)
+    points = [(math.log(x), math.log(y)) for x, y in zip(sizes, values) if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+
+    exponent = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+    coefficient = math.exp(mean_y - exponent * mean_x)
+    return coefficient, exponent
+
+
+def growth_curve(scales: List[float], measurements: List[float], metric: str) -> Optional[Tuple[float, float]]:
+    # The smallest scale approximates the fixed cost of a stage (interpreter, imports, templates),
+    # which would otherwise flatten the curve. Only the growth on top of it is fitted.
+    fixed = measurements[0]
+    points = [(x, y - fixed) for x, y in zip(scales[1:], measurements[1:]) if y - fixed > MIN_GROWTH[metric]]
+    return fit_power_law([x for x, _ in points], [y for _, y in points])
+
+
+def check_stage(name: str, scales: List[float], results: Dict, max_exponent: float,
+                check_projection: bool) -> Tuple[Dict, List[str]]:
+    failures = []
+    summary = {}
+
+    budget = BUDGETS.get(name, DEFAULT_BUDGET)
+
+    for metric in METRICS:
+        measurements = [results["{:g}".format(x)]["stages"][name][metric] for x in scales]
+        fit = growth_curve(scales, measurements, metric)
+
+        summary[metric] = {"measurements": measurements, "exponent": None, "projected": None}
+        if fit is None or (metric == "cpu_time" and measurements[-1] < MIN_TIME):
+            continue
+
+        coefficient, exponent = fit
+        projected = measurements[0] + coefficient * FULL_SCALE ** exponent
+        summary[metric]["exponent"] = exponent
+        summary[metric]["projected"] = projected
+
+        if exponent > max_exponent:
+            failures.append("{} {} grows super-linearly (exponent {:.2f} > {:.2f})".format(
+                name, metric, exponent, max_exponent))
+
+        if metric == "peak_rss" and check_projection and projected > budget:
+            failures.append("{} is projected to need {:.1f}MB at full size, over its {:.1f}MB budget".format(
+                name, projected / 2**20, budget / 2**20))
+
+    peak = max(summary["peak_rss"]["measurements"])
+    if peak > budget:
+        failures.append("{} used {:.1f}MB, over its {:.1f}MB budget".format(name, peak / 2**20, budget / 2**20))
+
+    return summary, failures
+
+
+def print_summary(summaries: Dict[str, Dict]):
+    print("{:<42} {:>10} {:>14} {:>10} {:>16}".format(
+        "stage", "time exp.", "projected (s)", "rss exp.", "projected (MB)"))
+
+    def format_value(value, scale=1.0, places=2):
+        return "-" if value is None else "{:.{}f}".format(value / scale, places)
+
+    for name, summary in summaries.items():
+        print("{:<42} {:>10} {:>14} {:>10} {:>16}".format(
+            name,
+            format_value(summary["cpu_time"]["exponent"]),
+            format_value(summary["cpu_time"]["projected"], places=1),
+            format_value(summary["peak_rss"]["exponent"]),
+            format_value(summary["peak_rss"]["projected"], 2**20, 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=float, nargs="+", default=[25, 250, 500, 1000, 2000])
+    parser.add_argument("--stages", type=str, nargs="+", default=[x[0] for x in benchmark.STAGES])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-exponent", type=float, default=MAX_EXPONENT)
+    parser.add_argument("--check-projection", action="store_true",
+                        help="also fail if the peak RSS projected for the full inputs is over budget")
+    parser.add_argument("--output", "-o", type=str, help="write the fitted curves to this JSON file")
+    args = parser.parse_args()
+
+    scales = sorted(args.scales)
+    if len(scales) < 3:
+        parser.error("at least three scales are needed to fit growth curves")
+
+    # The repeats go through every scale in turn, rather than repeating each scale back to back, so
+    # that a slow spell of the machine doesn't skew one scale and with it the curve
+    counts: Dict[float, Dict[str, int]] = {}
+    runs: Dict[float, List[Dict[str, Dict]]] = {x: [] for x in scales}
+    for _ in range(args.repeat):
+        for scale in scales:
+            counts[scale], reports = benchmark.run_workspace(scale, 0, args.stages)
+            runs[scale].append(reports)
+
+    results = {"{:g}".format(x): benchmark.summarise_runs(counts[x], runs[x]) for x in scales}
+
+    summaries = {}
+    failures = []
+    for name in args.stages:
+        summaries[name], stage_failures = check_stage(name, scales, results, args.max_exponent,
+                                                       args.check_projection)
+        failures += stage_failures
+
+    print_summary(summaries)
+
+    if args.output:
+        with open(args.output, "w") as out_file:
+            json.dump({"scales": scales, "stages": summaries, "failures": failures}, out_file, indent=2)
+
+    if failures:
+        print("\nFailed:\n    {}".format("\n    ".join(failures)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,106 @@
+import os
 import csv
 import MeCab
 import sqlite3
+import heapq
+import hashlib
 import argparse
 import jaconv
+import instrumentation
 
-from typing import Optional, List, Dict
+from typing import Iterable, Optional, List, Dict, Tuple
+
+from checkpoint import Checkpoint
 
 PARSER = MeCab.Tagger("-Ochasen")
 
+# Increase this whenever SentencePair.generate_ruby changes the HTML it outputs, so that rubytext
+# cached by earlier builds is regenerated
+RUBY_RULES_VERSION = 1
+
+# How many example sentences each word keeps by default. Common words have hundreds of sentences
+# in Tatoeba, and every sentence kept is copied into the word's page.
+SENTENCES_PER_WORD = 10
+# The length (in characters) of the Japanese sentences that make the best examples. Shorter ones
+# tend to lack context, longer ones bury the word.
+IDEAL_LENGTH = 16
+# Added to the score of sentences whose index names the JMdict sense the word is used in
+SENSE_BONUS = 0.5
+
+# Index lines converted between each commit (and checkpoint) of the database
+BATCH_SIZE = 10000
+
+
+class RubyCache:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(path)
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS Ruby (
+            hash TEXT PRIMARY KEY, -- SHA-1 of the Japanese sentence
+            ruby TEXT -- The sentence with HTML rubytext tags added
+        )
+        """)
+
+        self.db.execute("""
+        CREATE TABLE IF NOT EXISTS Version (
+            version TEXT -- The MeCab dictionary and ruby rules the cached ruby was generated with
+        )
+        """)
+
+        # Throw the cache away if the dictionary or rules have changed since it was written
+        version = self.version()
+        cached_version = self.db.execute("SELECT version FROM Version").fetchone()
+        if cached_version is None or cached_version[0] != version:
+            self.db.execute("DELETE FROM Ruby")
+            self.db.execute("DELETE FROM Version")
+            self.db.execute("INSERT INTO Version VALUES (?)", (version, ))
+            self.db.commit()
+
+    def version(self) -> str:
+        parts = ["rules {}".format(RUBY_RULES_VERSION), "mecab {}".format(MeCab.VERSION)]
+
+        info = PARSER.dictionary_info()
+        while info is not None:
+            modified = os.path.getmtime(info.filename) if os.path.exists(info.filename) else 0
+            parts.append("{} {} {} {}".format(info.filename, info.version, info.size, modified))
+            info = info.next
+
+        return ", ".join(parts)
+
+    def key(self, sentence: str) -> str:
+        return hashlib.sha1(sentence.encode("UTF-8")).hexdigest()
+
+    def get(self, sentence: str) -> Optional[str]:
+        result = self.db.execute("SELECT ruby FROM Ruby WHERE hash=?", (self.key(sentence), )).fetchone()
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result[0]
+
+    def add(self, sentence: str, ruby: str):
+        self.db.execute("INSERT OR REPLACE INTO Ruby VALUES (?, ?)", (self.key(sentence), ruby))
+
+    def commit(self):
+        self.db.commit()
+
+    def hit_rate(self) -> float:
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
 class WordIndex:
     def __init__(self, parameters: str):
         # The headword as it appears in the dictionary. This will take the Kanji form if available
@@ -37,18 +130,29 @@ class WordIndex:
 
 
 class SentencePair:
-    def __init__(self, jp_sentence: str, en_sentence: str, indices: str):
+    def __init__(self, jp_sentence: str, en_sentence: str, indices: str, ruby_cache: Optional[RubyCache] = None):
         # The sentence in Japanese
         self.jp: str = jp_sentence
         # The sentence in English
         self.en: str = en_sentence
         # The sentence in Japanese with Rubytext
-        self.jp_ruby: str = self.generate_ruby()
+        self.jp_ruby: str = self.get_ruby(ruby_cache)
 
         # A List of indices that the dictionary will use the assign appropriate
         # sentences, made up of the words contained within the sentence.
         self.indices: List[WordIndex] = self.generate_indices(indices)
 
+    def get_ruby(self, ruby_cache: Optional[RubyCache]) -> str:
+        # Only sentences that haven't been seen by an earlier build need to be tokenised
+        if ruby_cache is None:
+            return self.generate_ruby()
+
+        ruby = ruby_cache.get(self.jp)
+        if ruby is None:
+            ruby = self.generate_ruby()
+            ruby_cache.add(self.jp, ruby)
+        return ruby
+
     def generate_ruby(self):
         output = PARSER.parse(self.jp).splitlines()
 
@@ -87,39 +191,46 @@ class SentencePair:
         return result
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("string_file", type=argparse.FileType("r"))
-    parser.add_argument("index_file", type=argparse.FileType("r"))
-    parser.add_argument("--database", "-o", type=str)
-    args = parser.parse_args()
+def score_sentence(pair: SentencePair, word: WordIndex) -> float:
+    score = -abs(len(pair.jp) - IDEAL_LENGTH) / IDEAL_LENGTH
+    if word.sense_number is not None:
+        score += SENSE_BONUS
+    return score
 
-    # Create iterators for the input CSV files
-    string_csv = csv.reader(args.string_file, delimiter="\t")
-    index_csv = csv.reader(args.index_file, delimiter="\t")
 
-    # Generate an indexed list of strings in memory
-    sentence_list: Dict[str, str] = {}
+def pair_candidates(pair: SentencePair) -> Dict[str, float]:
+    # The score of the sentence for each word it's indexed under. A word indexed twice in one
+    # sentence is one candidate, with the better score.
+    best: Dict[str, float] = {}
+    for word in pair.indices:
+        best[word.dictionary_form] = max(best.get(word.dictionary_form, -1e9), score_sentence(pair, word))
+    return best
 
-    for index, language, sentence in string_csv:
-        if int(index) > 0 and language in ("jpn", "eng"):
-            sentence_list[index] = sentence
 
-    # Generate pairs of Japanese and English sentences with metadata
-    sentence_pairs: List[SentencePair] = []
+def select_sentences(candidates: Iterable[Tuple[str, int, float]], limit: int) -> Dict[str, Dict[int, Tuple[float, Optional[int]]]]:
+    # Keeps the best `limit` sentences of each word with a min-heap (0 keeps them all), given the
+    # (word, sentence id, score) candidates in sentence order. Returns the score and rank (None if
+    # not selected) of every candidate. Equal scores prefer the earlier sentence.
+    scores: Dict[str, Dict[int, float]] = {}
+    heaps: Dict[str, List[Tuple[float, int]]] = {}
 
-    for jp_id, en_id, parameters in index_csv:
-        # Check there's at least one verified word ("~" indicates verification)
-        if "~" in parameters:
-            if jp_id in sentence_list and en_id in sentence_list:
-                jp_sentence = sentence_list[jp_id]
-                en_sentence = sentence_list[en_id]
-                sentence_pair = SentencePair(jp_sentence, en_sentence, parameters)
-                sentence_pairs.append(sentence_pair)
+    for word, index, score in candidates:
+        scores.setdefault(word, {})[index] = score
 
-    db = sqlite3.connect(args.database)
-    cursor = db.cursor()
+        heap = heaps.setdefault(word, [])
+        if limit == 0 or len(heap) < limit:
+            heapq.heappush(heap, (score, -index))
+        elif (score, -index) > heap[0]:
+            heapq.heapreplace(heap, (score, -index))
 
+    result = {}
+    for word, word_scores in scores.items():
+        ranks = {-index: rank for rank, (_, index) in enumerate(sorted(heaps[word], reverse=True))}
+        result[word] = {index: (score, ranks.get(index)) for index, score in word_scores.items()}
+    return result
+
+
+def create_tables(cursor):
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS Sentences (
         id INTEGER PRIMARY KEY, -- Will be used to refer to sentence pairs by containing word
@@ -131,23 +242,139 @@ def main():
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS SentenceWords (
         word TEXT, -- A word that the sentence_id pair contains
-        id INTEGER REFERENCES Sentences(id)
+        id INTEGER REFERENCES Sentences(id),
+        score REAL, -- How good an example of the word the sentence is (see score_sentence)
+        rank INTEGER -- Position among the word's selected sentences, NULL if not selected
     )
     """)
 
     cursor.execute("""
     CREATE VIEW IF NOT EXISTS SentencePairs AS 
         SELECT word, en, jp FROM SentenceWords JOIN Sentences ON (SentenceWords.id = Sentences.id)
+        WHERE rank IS NOT NULL
     """)
 
-    for index, pair in enumerate(sentence_pairs):
-        cursor.execute("INSERT OR IGNORE INTO Sentences VALUES (?, ?, ?)", (index, pair.en, pair.jp_ruby))
-        for word in pair.indices:
-            cursor.execute("INSERT OR IGNORE INTO SentenceWords VALUES (?, ?)", (word.dictionary_form, index))
-    
-    cursor.close()
-    db.commit()
-    db.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("string_file", type=argparse.FileType("r"))
+    parser.add_argument("index_file", type=argparse.FileType("r"))
+    parser.add_argument("--database", "-o", type=str)
+    parser.add_argument("--ruby-cache", type=str, default="cache/ruby_cache.db",
+                        help="where to keep the rubytext of previously converted sentences")
+    parser.add_argument("--no-ruby-cache", action="store_true")
+    parser.add_argument("--sentences-per-word", type=int, default=SENTENCES_PER_WORD,
+                        help="example sentences kept for each word (0 keeps them all)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="index lines converted between each commit and checkpoint")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from the last checkpoint of an interrupted run")
+    args = parser.parse_args()
+
+    with instrumentation.stage("sentence_converter") as report:
+        # Create iterators for the input CSV files
+        string_csv = csv.reader(args.string_file, delimiter="\t")
+        index_csv = csv.reader(args.index_file, delimiter="\t")
+
+        # Generate an indexed list of strings in memory
+        sentence_list: Dict[str, str] = {}
+
+        with report.phase("parse") as phase:
+            for index, language, sentence in string_csv:
+                phase.records += 1
+                if int(index) > 0 and language in ("jpn", "eng"):
+                    sentence_list[index] = sentence
+
+        # Other stages may be writing to the database at the same time (see build.py)
+        db = sqlite3.connect(args.database, timeout=600)
+        cursor = db.cursor()
+        create_tables(cursor)
+
+        # The sentences are converted and written in batches, each committed along with the number
+        # of index lines done so far, so an interrupted run can carry on where it stopped
+        checkpoint = Checkpoint(db, "sentence_converter")
+        saved = checkpoint.load() if args.resume else None
+
+        if saved is None:
+            cursor.execute("DELETE FROM Sentences")
+            cursor.execute("DELETE FROM SentenceWords")
+            position, pair_count = 0, 0
+        else:
+            position, pair_count = saved[0], saved[1]["pairs"]
+            print("Resuming after {} index lines ({} sentence pairs)".format(position, pair_count))
+
+        ruby_cache = None if args.no_ruby_cache else RubyCache(args.ruby_cache)
+
+        with report.phase("ruby") as phase:
+            line_number = 0
+            for line_number, (jp_id, en_id, parameters) in enumerate(index_csv, 1):
+                if line_number <= position:
+                    continue
+
+                # Check there's at least one verified word ("~" indicates verification)
+                if "~" in parameters:
+                    if jp_id in sentence_list and en_id in sentence_list:
+                        jp_sentence = sentence_list[jp_id]
+                        en_sentence = sentence_list[en_id]
+                        pair = SentencePair(jp_sentence, en_sentence, parameters, ruby_cache)
+
+                        cursor.execute("INSERT OR IGNORE INTO Sentences VALUES (?, ?, ?)", (pair_count, pair.en, pair.jp_ruby))
+                        for word, score in pair_candidates(pair).items():
+                            cursor.execute("INSERT INTO SentenceWords VALUES (?, ?, ?, NULL)", (word, pair_count, score))
+                        pair_count += 1
+                        phase.records += 1
+
+                if line_number % args.batch_size == 0:
+                    if ruby_cache is not None:
+                        ruby_cache.commit()
+                    checkpoint.save(line_number, {"pairs": pair_count})
+                    db.commit()
+
+            checkpoint.save(max(line_number, position), {"pairs": pair_count})
+            db.commit()
+
+        if ruby_cache is not None:
+            ruby_cache.close()
+            report.count("ruby cache hits", ruby_cache.hits)
+            report.count("ruby cache misses", ruby_cache.misses)
+            print("Ruby cache: {} hits, {} misses ({:.1%} hit rate)".format(
+                ruby_cache.hits, ruby_cache.misses, ruby_cache.hit_rate()))
+
+        with report.phase("select", pair_count):
+            candidates = cursor.execute("SELECT word, id, score FROM SentenceWords ORDER BY id, rowid").fetchall()
+            selection = select_sentences(candidates, args.sentences_per_word)
+
+            # Each selected sentence is copied into the page of its word
+            sizes = dict(cursor.execute(
+                "SELECT id, length(CAST(en AS BLOB)) + length(CAST(jp AS BLOB)) FROM Sentences").fetchall())
+            for word_candidates in selection.values():
+                for index, (_, rank) in word_candidates.items():
+                    report.count("candidate sentences")
+                    report.count("candidate bytes", sizes[index])
+                    if rank is not None:
+                        report.count("selected sentences")
+                        report.count("selected bytes", sizes[index])
+
+            counters = report.counters
+            saved_bytes = counters.get("candidate bytes", 0) - counters.get("selected bytes", 0)
+            print("Selected {} of {} word sentences (at most {} per word), saving {} of {} bytes ({:.1%})".format(
+                counters.get("selected sentences", 0), counters.get("candidate sentences", 0),
+                args.sentences_per_word or "all", saved_bytes, counters.get("candidate bytes", 0),
+                saved_bytes / counters["candidate bytes"] if counters.get("candidate bytes") else 0.0))
+
+        with report.phase("write database", pair_count):
+            cursor.execute("CREATE INDEX IF NOT EXISTS SentenceWordsId ON SentenceWords (id, word)")
+            cursor.execute("UPDATE SentenceWords SET rank = NULL")
+            for word, word_candidates in selection.items():
+                for index, (_, rank) in word_candidates.items():
+                    if rank is not None:
+                        cursor.execute("UPDATE SentenceWords SET rank = ? WHERE id = ? AND word = ?", (rank, index, word))
+
+            cursor.close()
+            db.commit()
+            db.close()
+
+        report.add_records(pair_count)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,166 @@
+import sys
+import zlib
+import gzip
+import json
+import hashlib
+import argparse
+import xml.etree.ElementTree as ElementTree
+
+from typing import BinaryIO, Dict, List
+
+COPY_CHUNK = 2**20
+
+# How ElementTree names the d:entry tags of a parsed dictionary
+ENTRY_TAG = "{http://www.apple.com/DTDs/DictionaryService-1.0.rng}entry"
+
+
+def shard_of(page_id: str, shards: int) -> int:
+    # Stable between runs and processes, unlike hash()
+    return zlib.crc32(page_id.encode("UTF-8")) % shards
+
+
+def split_extension(path: str):
+    for suffix in (".xml.gz", ".xml", ".gz"):
+        if path.endswith(suffix):
+            return path[:-len(suffix)], suffix
+    return path, ""
+
+
+def shard_path(path: str, shard: int, shards: int) -> str:
+    # build/JapaneseDictionary.xml -> build/JapaneseDictionary.03-of-08.xml
+    base, extension = split_extension(path)
+    return "{}.{:02d}-of-{:02d}{}".format(base, shard, shards, extension)
+
+
+def manifest_path(path: str) -> str:
+    # build/JapaneseDictionary.xml -> build/JapaneseDictionary.shards.json
+    return "{}.shards.json".format(split_extension(path)[0])
+
+
+def open_shard(path: str) -> BinaryIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as in_file:
+        for chunk in iter(lambda: in_file.read(COPY_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_shard_manifest(path: str, shards: List[Dict]):
+    # Every shard is a complete dictionary document, with the same header and footer, so that it
+    # can be validated on its own. Concatenating them drops all but the first header and last footer.
+    manifest = {
+        "header": shards[0]["header"],
+        "footer": shards[0]["footer"],
+        "shards": [
+            {
+                "path": x["path"],
+                "entries": x["entries"],
+                "bytes": x["bytes"],
+                "sha256": file_hash(x["path"]),
+            }
+            for x in shards
+        ],
+    }
+    with open(path, "w") as out_file:
+        json.dump(manifest, out_file, indent=2, ensure_ascii=False)
+
+
+def read_shard_manifest(path: str) -> Dict:
+    with open(path) as in_file:
+        return json.load(in_file)
+
+
+def copy_body(in_file: BinaryIO, out_file: BinaryIO, header: bytes, footer: bytes):
+    # Copies a shard without its header and footer, a chunk at a time
+    if in_file.read(len(header)) != header:
+        raise ValueError("Shard doesn't start with the dictionary header")
+
+    held = b""
+    for chunk in iter(lambda: in_file.read(COPY_CHUNK), b""):
+        held += chunk
+        # Hold back enough bytes to strip the footer once the end is reached
+        out_file.write(held[:-len(footer)])
+        held = held[-len(footer):]
+
+    if held != footer:
+        raise ValueError("Shard doesn't end with the dictionary footer")
+
+
+def concatenate_shards(manifest_path: str, output: str) -> int:
+    manifest = read_shard_manifest(manifest_path)
+    header = manifest["header"].encode("UTF-8")
+    footer = manifest["footer"].encode("UTF-8")
+
+    opener = gzip.open if output.endswith(".gz") else open
+    with opener(output, "wb") as out_file:
+        out_file.write(header)
+        for shard in manifest["shards"]:
+            with open_shard(shard["path"]) as in_file:
+                copy_body(in_file, out_file, header, footer)
+        out_file.write(footer)
+
+    return len(manifest["shards"])
+
+
+def validate_shards(manifest_path: str) -> List[str]:
+    # Checks the shards one at a time, so only one is ever parsed at once
+    manifest = read_shard_manifest(manifest_path)
+    errors = []
+    page_ids = set()
+
+    for shard in manifest["shards"]:
+        if file_hash(shard["path"]) != shard["sha256"]:
+            errors.append("{}: contents don't match the manifest".format(shard["path"]))
+            continue
+
+        entries = 0
+        with open_shard(shard["path"]) as in_file:
+            for _, tag in ElementTree.iterparse(in_file):
+                if tag.tag == ENTRY_TAG:
+                    entries += 1
+                    page_id = tag.attrib["id"]
+                    if page_id in page_ids:
+                        errors.append("{}: duplicate page id {}".format(shard["path"], page_id))
+                    page_ids.add(page_id)
+                    tag.clear()
+
+        expected = sum(shard["entries"].values()) - shard["entries"]["kanji_image"]
+        if entries != expected:
+            errors.append("{}: {} entries, the manifest lists {}".format(shard["path"], entries, expected))
+
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    concatenate = subparsers.add_parser("concatenate", help="join the shards into a single dictionary file")
+    concatenate.add_argument("manifest", type=str)
+    concatenate.add_argument("--output", "-o", type=str, required=True)
+
+    validate = subparsers.add_parser("validate", help="check every shard against the manifest")
+    validate.add_argument("manifest", type=str)
+
+    args = parser.parse_args()
+
+    if args.command == "concatenate":
+        count = concatenate_shards(args.manifest, args.output)
+        print("Concatenated {} shards into {}".format(count, args.output))
+    else:
+        errors = validate_shards(args.manifest)
+        for error in errors:
+            print(error)
+        if errors:
+            sys.exit(1)
+        print("All shards are valid")
+
+
+if __name__ == "__main__":
+    main()
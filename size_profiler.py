@@ -0,0 +1,176 @@
+import json
+import heapq
+import argparse
+import xml.etree.ElementTree as ElementTree
+
+from typing import Dict, List, Optional, Tuple
+
+# How many of the largest entries are kept
+TOP_ENTRIES = 20
+# Elements counted as a section of their own wherever they appear, besides those with an id
+TRACKED_CLASSES = {"badge"}
+
+
+def element_size(element: ElementTree.Element) -> int:
+    # The bytes the element takes up in the output, not counting the text after it
+    tail, element.tail = element.tail, None
+    size = len(ElementTree.tostring(element, encoding="UTF-8", xml_declaration=False))
+    element.tail = tail
+    return size
+
+
+def section_name(element: ElementTree.Element) -> Optional[str]:
+    if element.tag == "d:index":
+        return "index"
+    if "id" in element.attrib:
+        return element.attrib["id"]
+    if element.attrib.get("class") in TRACKED_CLASSES:
+        return element.attrib["class"]
+    return None
+
+
+def measure_sections(entry: ElementTree.Element, sections: Dict[str, int]) -> int:
+    # Adds the bytes of each section of the entry to sections. Sections nested in another section
+    # are only counted once, as part of the innermost one. Anything outside of every section (the
+    # entry's own tags, the script, ...) is counted as "other". Returns the size of the entry.
+    def visit(element: ElementTree.Element) -> int:
+        nested = 0
+        for child in element:
+            name = section_name(child)
+            if name is None:
+                nested += visit(child)
+            else:
+                size = element_size(child)
+                sections[name] = sections.get(name, 0) + size - visit(child)
+                nested += size
+        return nested
+
+    total = element_size(entry)
+    sections["other"] = sections.get("other", 0) + total - visit(entry)
+    return total
+
+
+def whitespace_size(entry: ElementTree.Element) -> int:
+    # Whitespace-only text between tags, which xmllint --noblanks removes later in the build
+    result = 0
+    for element in entry.iter():
+        for text in (element.text, element.tail if element is not entry else None):
+            if text and not text.strip():
+                result += len(text.encode("UTF-8"))
+    return result
+
+
+class SizeProfile:
+    def __init__(self, top: int = TOP_ENTRIES):
+        self.top: int = top
+        # Per entry type
+        self.sizes: Dict[str, List[int]] = {}
+        self.sections: Dict[str, Dict[str, int]] = {}
+        self.whitespace: Dict[str, int] = {}
+        # Min-heap of the largest (size, page id, entry type)
+        self.largest: List[Tuple[int, str, str]] = []
+
+    def add(self, entry_type: str, page_id: str, entry: ElementTree.Element):
+        size = measure_sections(entry, self.sections.setdefault(entry_type, {}))
+        self.sizes.setdefault(entry_type, []).append(size)
+        self.whitespace[entry_type] = self.whitespace.get(entry_type, 0) + whitespace_size(entry)
+        self._add_largest((size, page_id, entry_type))
+
+    def _add_largest(self, item: Tuple[int, str, str]):
+        if len(self.largest) < self.top:
+            heapq.heappush(self.largest, item)
+        elif item > self.largest[0]:
+            heapq.heapreplace(self.largest, item)
+
+    def merge(self, other: "SizeProfile"):
+        # Combines the profiles of the shards of one dictionary
+        for entry_type, sizes in other.sizes.items():
+            self.sizes.setdefault(entry_type, []).extend(sizes)
+            self.whitespace[entry_type] = self.whitespace.get(entry_type, 0) + other.whitespace.get(entry_type, 0)
+            sections = self.sections.setdefault(entry_type, {})
+            for name, size in other.sections.get(entry_type, {}).items():
+                sections[name] = sections.get(name, 0) + size
+        for item in other.largest:
+            self._add_largest(tuple(item))
+
+    def to_dict(self) -> Dict:
+        result = {"types": {}, "largest": [
+            {"page_id": page_id, "type": entry_type, "bytes": size}
+            for size, page_id, entry_type in sorted(self.largest, reverse=True)
+        ]}
+
+        for entry_type, sizes in self.sizes.items():
+            total = sum(sizes)
+            sections = sorted(self.sections[entry_type].items(), key=lambda x: x[1], reverse=True)
+            result["types"][entry_type] = {
+                "entries": len(sizes),
+                "bytes": total,
+                "whitespace": self.whitespace[entry_type],
+                "histogram": histogram(sizes),
+                "sections": {name: {"bytes": size, "share": size / total if total else 0.0} for name, size in sections},
+                "sizes": sizes,
+            }
+
+        return result
+
+
+def histogram(sizes: List[int]) -> List[Tuple[int, int]]:
+    # Number of entries in power of two size buckets, as (upper bound in bytes, count)
+    counts: Dict[int, int] = {}
+    for size in sizes:
+        bound = 1 << max(size - 1, 0).bit_length()
+        counts[bound] = counts.get(bound, 0) + 1
+    return sorted(counts.items())
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return "{:.0f}{}".format(size, unit)
+        size /= 1024
+    return "{:.1f}GB".format(size)
+
+
+def format_profile(profile: Dict, width: int = 40) -> str:
+    lines = []
+
+    for entry_type, values in profile["types"].items():
+        average = values["bytes"] / values["entries"] if values["entries"] else 0
+        lines.append("{}: {} entries, {} ({} on average, {} whitespace)".format(
+            entry_type, values["entries"], format_bytes(values["bytes"]), format_bytes(average),
+            format_bytes(values["whitespace"])))
+
+        largest = max((count for _, count in values["histogram"]), default=0)
+        for bound, count in values["histogram"]:
+            bar = "#" * max(1, round(count / largest * width))
+            lines.append("    <= {:>7} {:>8} {}".format(format_bytes(bound), count, bar))
+
+        lines.append("    sections:")
+        for name, section in values["sections"].items():
+            lines.append("        {:<20} {:>9} {:>6.1%}".format(name, format_bytes(section["bytes"]), section["share"]))
+        lines.append("")
+
+    lines.append("Largest entries:")
+    for entry in profile["largest"]:
+        lines.append("    {:>9} {:<14} {}".format(format_bytes(entry["bytes"]), entry["type"], entry["page_id"]))
+
+    return "\n".join(lines)
+
+
+def write_profile(path: str, profile: Dict):
+    with open(path, "w") as out_file:
+        json.dump(profile, out_file, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("profile", type=str, nargs="?", default="output/size_profile.json",
+                        help="profile written by combiner.py --size-profile")
+    args = parser.parse_args()
+
+    with open(args.profile) as in_file:
+        print(format_profile(json.load(in_file)))
+
+
+if __name__ == "__main__":
+    main()
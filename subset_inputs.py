@@ -0,0 +1,242 @@
+import os
+import re
+import zlib
+import shutil
+import argparse
+
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# The downloads subset_inputs reads from the input directory, and writes under the same names
+JMDICT = "JMdict_e.xml"
+KANJIDIC = "kanjidic2.xml"
+SENTENCES = "sentences.csv"
+INDICES = "jpn_indices.csv"
+DISTANCES = ["stroke_distance.csv", "radical_distance.csv"]
+# Copied as they are
+OTHER_INPUTS = ["english.txt"]
+
+KEB = re.compile(r"<keb>(.*?)</keb>")
+REB = re.compile(r"<reb>(.*?)</reb>")
+ENT_SEQ = re.compile(r"<ent_seq>(.*?)</ent_seq>")
+LITERAL = re.compile(r"<literal>(.*?)</literal>")
+
+# Entries are chosen by a hash of their sequence number, so the same percentage always gives the
+# same subset, and a smaller percentage gives a subset of a larger one
+PERCENT_BUCKETS = 10000
+
+
+def split_records(lines: Iterator[str], tag: str) -> Iterator[Tuple[bool, str]]:
+    # Splits JMdict or KANJIDIC2 into (True, record) for each <entry> or <character> and (False, text)
+    # for everything around them (the prolog with its DTD, comments and the end of the root). The
+    # records are kept as text rather than parsed, so the entity references (e.g. &n;) are copied as
+    # they are instead of being expanded.
+    start, end = "<{}>".format(tag), "</{}>".format(tag)
+    record: List[str] = []
+    other: List[str] = []
+
+    for line in lines:
+        if not record and start not in line:
+            other.append(line)
+            continue
+
+        if not record:
+            if other:
+                yield False, "".join(other)
+                other = []
+
+        record.append(line)
+        if end in line:
+            yield True, "".join(record)
+            record = []
+
+    if record:
+        raise ValueError("Unterminated <{}> at the end of the file".format(tag))
+    if other:
+        yield False, "".join(other)
+
+
+def filter_records(in_path: str, out_path: str, tag: str, keep: Callable[[str], bool]) -> Tuple[int, int]:
+    # Copies the records that keep returns True for, along with the prolog and the end of the root
+    # element. Text between records is only copied before the first and after the last record.
+    kept, total = 0, 0
+    pending: Optional[str] = None
+
+    with open(in_path, encoding="UTF-8") as in_file, open(out_path, "w", encoding="UTF-8") as out_file:
+        for is_record, text in split_records(in_file, tag):
+            if not is_record:
+                if total == 0:
+                    out_file.write(text)
+                else:
+                    pending = text
+                continue
+
+            pending = None
+            total += 1
+            if keep(text):
+                out_file.write(text)
+                kept += 1
+
+        if pending is not None:
+            out_file.write(pending)
+
+    return kept, total
+
+
+def sentence_headwords(parameters: str) -> List[str]:
+    # The headwords of the verified words of a jpn_indices line, as sentence_converter reads them
+    # (see WordIndex.get_headword)
+    result = []
+    for index in parameters.split(" "):
+        if "~" in index:
+            result.append(re.split(r"[|(\[{~]", index, 1)[0])
+    return result
+
+
+class Subset:
+    def __init__(self, seeds: Optional[Set[str]] = None, percent: Optional[float] = None):
+        self.seeds = seeds or set()
+        self.percent = percent
+
+        # Everything the chosen entries refer to, filled in as each file is read
+        self.forms: Set[str] = set()
+        self.kanji: Set[str] = set()
+        self.sentence_ids: Set[str] = set()
+        # Each kanji's similar kanji (which get a link on its page) in each distance file
+        self.similar: Dict[str, Dict[str, List[str]]] = {}
+
+    def choose_entry(self, record: str) -> bool:
+        kanji = KEB.findall(record)
+        forms = kanji + REB.findall(record)
+
+        if self.percent is not None:
+            sequence = ENT_SEQ.search(record).group(1)
+            chosen = zlib.crc32(sequence.encode()) % PERCENT_BUCKETS < self.percent * PERCENT_BUCKETS / 100
+        else:
+            chosen = not self.seeds.isdisjoint(forms)
+
+        if chosen:
+            self.forms.update(forms)
+            # Every character of the kanji forms, whether or not KANJIDIC2 has it
+            self.kanji.update(character for form in kanji for character in form)
+        return chosen
+
+    def read_similar_kanji(self, path: str):
+        # The distance files are small, so are read whole to find the similar kanji of the chosen
+        # kanji before the other files are written
+        similar = {}
+        with open(path, encoding="UTF-8") as in_file:
+            for line in in_file:
+                fields = line.split()
+                if fields and fields[0] in self.kanji:
+                    similar[fields[0]] = fields[1::2]
+        self.similar[path] = similar
+
+    def add_similar_kanji(self):
+        for similar in self.similar.values():
+            for characters in similar.values():
+                self.kanji.update(characters)
+
+    def choose_kanji(self, record: str) -> bool:
+        return LITERAL.search(record).group(1) in self.kanji
+
+    def write_distances(self, in_path: str, out_path: str) -> Tuple[int, int]:
+        # Keeps the rows of every kanji in the subset, without the pairs whose similar kanji isn't
+        kept, total = 0, 0
+        with open(in_path, encoding="UTF-8") as in_file, open(out_path, "w", encoding="UTF-8") as out_file:
+            for line in in_file:
+                fields = line.split()
+                total += 1
+                if not fields or fields[0] not in self.kanji:
+                    continue
+                pairs = [x for x in zip(fields[1::2], fields[2::2]) if x[0] in self.kanji]
+                out_file.write(" ".join([fields[0], *(" ".join(x) for x in pairs)]) + "\n")
+                kept += 1
+        return kept, total
+
+    def write_indices(self, in_path: str, out_path: str) -> Tuple[int, int]:
+        # Keeps the sentence pairs that any chosen entry is verified to appear in
+        kept, total = 0, 0
+        with open(in_path, encoding="UTF-8") as in_file, open(out_path, "w", encoding="UTF-8") as out_file:
+            for line in in_file:
+                total += 1
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 3:
+                    continue
+                jp_id, en_id, parameters = fields
+                if not self.forms.isdisjoint(sentence_headwords(parameters)):
+                    out_file.write(line)
+                    self.sentence_ids.update((jp_id, en_id))
+                    kept += 1
+        return kept, total
+
+    def write_sentences(self, in_path: str, out_path: str) -> Tuple[int, int]:
+        kept, total = 0, 0
+        with open(in_path, encoding="UTF-8") as in_file, open(out_path, "w", encoding="UTF-8") as out_file:
+            for line in in_file:
+                total += 1
+                if line.split("\t", 1)[0] in self.sentence_ids:
+                    out_file.write(line)
+                    kept += 1
+        return kept, total
+
+
+def write_subset(input_directory: str, output_directory: str, subset: Subset) -> Dict[str, Tuple[int, int]]:
+    # Returns the (kept, total) records of every file. Each file is read once, apart from the
+    # distance files, in the order that the references between them need.
+    os.makedirs(output_directory, exist_ok=True)
+
+    def paths(name: str) -> Tuple[str, str]:
+        return os.path.join(input_directory, name), os.path.join(output_directory, name)
+
+    counts = {}
+    counts[JMDICT] = filter_records(*paths(JMDICT), "entry", subset.choose_entry)
+
+    for name in DISTANCES:
+        subset.read_similar_kanji(paths(name)[0])
+    subset.add_similar_kanji()
+
+    counts[KANJIDIC] = filter_records(*paths(KANJIDIC), "character", subset.choose_kanji)
+    for name in DISTANCES:
+        counts[name] = subset.write_distances(*paths(name))
+
+    # The index lines decide which sentences are needed, so are read first
+    counts[INDICES] = subset.write_indices(*paths(INDICES))
+    counts[SENTENCES] = subset.write_sentences(*paths(SENTENCES))
+
+    for name in OTHER_INPUTS:
+        if os.path.exists(paths(name)[0]):
+            shutil.copyfile(*paths(name))
+
+    return counts
+
+
+def read_seeds(path: str) -> Set[str]:
+    with open(path, encoding="UTF-8") as in_file:
+        return {x.strip() for x in in_file if x.strip() and not x.startswith("#")}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output", type=str, help="directory to write the subset to, e.g. input/subset")
+    parser.add_argument("--input", "-i", type=str, default="input", help="directory of the full downloads")
+    choice = parser.add_mutually_exclusive_group(required=True)
+    choice.add_argument("--seeds", type=str, help="file of words (kanji forms or readings) to keep, one per line")
+    choice.add_argument("--percent", "-p", type=float, help="percentage of the JMdict entries to keep")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.output) == os.path.abspath(args.input):
+        parser.error("The subset can't be written over its input")
+
+    if args.seeds:
+        subset = Subset(seeds=read_seeds(args.seeds))
+    else:
+        subset = Subset(percent=args.percent)
+
+    counts = write_subset(args.input, args.output, subset)
+
+    for name, (kept, total) in counts.items():
+        print("    {:<22} {:>9} of {:>9} records".format(name, kept, total))
+
+
+if __name__ == "__main__":
+    main()
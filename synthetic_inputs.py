@@ -0,0 +1,328 @@
+import io
+import os
+import random
+import tarfile
+import argparse
+
+from xml.sax.saxutils import escape
+from typing import Dict, List, Tuple
+
+# The DTDs (and so the entity and default attribute definitions) are copied from the samples,
+# so that the generated files parse exactly like the real JMdict and KANJIDIC2 downloads.
+SAMPLE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input")
+JMDICT_SAMPLE = os.path.join(SAMPLE_DIRECTORY, "JMdict_e_sample.xml")
+KANJIDIC_SAMPLE = os.path.join(SAMPLE_DIRECTORY, "kanjidic2_sample.xml")
+
+# Scale 1 matches the size of the samples. Real downloads are roughly 30000x (JMdict),
+# 4000x (KANJIDIC2) and 30000x (Tatoeba pairs) this size.
+BASE_ENTRIES = 6
+BASE_CHARACTERS = 3
+BASE_SENTENCES = 6
+
+HIRAGANA = [chr(x) for x in range(ord("あ"), ord("ん") + 1) if chr(x) not in "ぁぃぅぇぉっゃゅょゎゐゑ"]
+
+# Parts of speech as JMdict entity names, with the kana that verbs of that class must end in
+VERB_ENDINGS = {
+    "v1": "る", "v5k": "く", "v5g": "ぐ", "v5s": "す", "v5t": "つ", "v5u": "う",
+    "v5r": "る", "v5m": "む", "v5b": "ぶ",
+}
+OTHER_POS = ["n", "n", "n", "n", "vs", "adj-no", "adj-na", "adv", "exp", "n-adv", "ctr"]
+ADJECTIVE_POS = "adj-i"
+
+PARTICLES = ["は", "が", "を", "に", "で", "と", "も", "の"]
+
+
+class Generator:
+    def __init__(self, scale: float, seed: int):
+        self.random = random.Random(seed)
+
+        self.entry_count = max(1, round(BASE_ENTRIES * scale))
+        self.character_count = max(1, round(BASE_CHARACTERS * scale))
+        self.sentence_count = max(1, round(BASE_SENTENCES * scale))
+
+        # Kanji are taken in order from the CJK unified ideographs block
+        self.characters: List[str] = [chr(0x4e00 + x) for x in range(self.character_count)]
+
+        # English vocabulary shared by the glosses, kanji meanings and sentences. Words are
+        # chosen with a skewed distribution so that common English words map to many entries.
+        self.vocabulary: List[str] = [self.english_word() for _ in range(self.entry_count * 2)]
+
+        # (kanji forms, readings, pos entity names, glosses per sense) for every entry
+        self.entries: List[Tuple[List[str], List[str], List[str], List[List[str]]]] = []
+
+    def kana(self, minimum: int, maximum: int) -> str:
+        length = self.random.randint(minimum, maximum)
+        return "".join(self.random.choice(HIRAGANA) for _ in range(length))
+
+    def english_word(self) -> str:
+        syllables = ["ka", "ro", "mi", "te", "sun", "lo", "ver", "an", "ing", "ble", "tor", "est"]
+        return "".join(self.random.choice(syllables) for _ in range(self.random.randint(1, 3)))
+
+    def gloss(self) -> str:
+        index = min(int(self.random.paretovariate(1.2)) - 1, len(self.vocabulary) - 1)
+        word = self.vocabulary[index]
+        # Some glosses carry an explanation or are long phrases, like the real data
+        roll = self.random.random()
+        if roll < 0.1:
+            return "{} ({})".format(word, self.random.choice(self.vocabulary))
+        if roll < 0.15:
+            return " ".join(self.random.choice(self.vocabulary) for _ in range(8))
+        return word
+
+    def pos(self) -> str:
+        roll = self.random.random()
+        if roll < 0.3:
+            return self.random.choice(list(VERB_ENDINGS))
+        if roll < 0.4:
+            return ADJECTIVE_POS
+        return self.random.choice(OTHER_POS)
+
+    def generate_entries(self):
+        for _ in range(self.entry_count):
+            # A few percent of entries share a headword with an earlier entry, as in JMdict. A share
+            # of those all repeat the first entry's, so that one title gets more entries the larger
+            # the scale, like the dozens of entries read かける or とる.
+            roll = self.random.random()
+            if self.entries and roll < 0.01:
+                kanji, readings, _, _ = self.entries[0]
+                pos = self.pos()
+            elif self.entries and roll < 0.04:
+                kanji, readings, _, _ = self.random.choice(self.entries)
+                pos = self.pos()
+            else:
+                pos = self.pos()
+                ending = VERB_ENDINGS.get(pos, "い" if pos == ADJECTIVE_POS else "")
+
+                readings = [self.kana(1, 4) + ending for _ in range(self.random.choice([1, 1, 1, 2]))]
+                kanji = []
+                # Roughly a fifth of JMdict entries are kana only
+                if self.random.random() < 0.8:
+                    for _ in range(self.random.choice([1, 1, 2])):
+                        stem = "".join(self.random.choice(self.characters) for _ in range(self.random.randint(1, 2)))
+                        kanji.append(stem + ending)
+
+            # Glosses within a sense are unique
+            senses = [list(dict.fromkeys(self.gloss() for _ in range(self.random.randint(1, 4))))
+                      for _ in range(self.random.randint(1, 4))]
+            self.entries.append((kanji, readings, [pos], senses))
+
+    def jmdict(self) -> str:
+        lines = []
+        for index, (kanji, readings, pos, senses) in enumerate(self.entries):
+            lines.append("<entry>")
+            lines.append("<ent_seq>{}</ent_seq>".format(1000000 + index))
+            for keb in kanji:
+                lines.append("<k_ele>")
+                lines.append("<keb>{}</keb>".format(keb))
+                if self.random.random() < 0.3:
+                    lines.append("<ke_pri>{}</ke_pri>".format(self.priority()))
+                lines.append("</k_ele>")
+            for reb in readings:
+                lines.append("<r_ele>")
+                lines.append("<reb>{}</reb>".format(reb))
+                if self.random.random() < 0.3:
+                    lines.append("<re_pri>{}</re_pri>".format(self.priority()))
+                lines.append("</r_ele>")
+            for sense_index, glosses in enumerate(senses):
+                lines.append("<sense>")
+                # As in JMdict, later senses usually inherit the parts of speech of the first
+                if sense_index == 0:
+                    lines.extend("<pos>&{};</pos>".format(x) for x in pos)
+                if self.random.random() < 0.05:
+                    lines.append("<misc>&uk;</misc>")
+                lines.extend("<gloss>{}</gloss>".format(escape(x)) for x in glosses)
+                lines.append("</sense>")
+            lines.append("</entry>")
+        return "\n".join(lines)
+
+    def priority(self) -> str:
+        return self.random.choice(["news1", "ichi1", "spec1", "news2", "ichi2", "spec2", "gai1",
+                                   "nf{:02d}".format(self.random.randint(1, 48))])
+
+    def kanjidic(self) -> str:
+        lines = []
+        for character in self.characters:
+            lines.append("<character>")
+            lines.append("<literal>{}</literal>".format(character))
+            lines.append("<codepoint>")
+            lines.append('<cp_value cp_type="ucs">{:x}</cp_value>'.format(ord(character)))
+            lines.append("</codepoint>")
+            lines.append("<radical>")
+            lines.append('<rad_value rad_type="classical">{}</rad_value>'.format(self.random.randint(1, 214)))
+            lines.append("</radical>")
+            lines.append("<misc>")
+            lines.append("<stroke_count>{}</stroke_count>".format(self.random.randint(1, 24)))
+            lines.append("</misc>")
+            # A small share of KANJIDIC2 characters have no readings or meanings at all
+            if self.random.random() < 0.95:
+                lines.append("<reading_meaning>")
+                lines.append("<rmgroup>")
+                lines.append('<reading r_type="pinyin">{}</reading>'.format(self.english_word()))
+                for _ in range(self.random.randint(0, 2)):
+                    on_yomi = "".join(chr(ord(x) + 0x60) for x in self.kana(1, 3))
+                    lines.append('<reading r_type="ja_on">{}</reading>'.format(on_yomi))
+                for _ in range(self.random.randint(0, 4)):
+                    lines.append('<reading r_type="ja_kun">{}</reading>'.format(self.kana(1, 4)))
+                for _ in range(self.random.randint(1, 3)):
+                    lines.append("<meaning>{}</meaning>".format(escape(self.random.choice(self.vocabulary))))
+                lines.append('<meaning m_lang="fr">{}</meaning>'.format(self.english_word()))
+                lines.append("</rmgroup>")
+                for _ in range(self.random.randint(0, 3)):
+                    lines.append("<nanori>{}</nanori>".format(self.kana(1, 3)))
+                lines.append("</reading_meaning>")
+            lines.append("</character>")
+        return "\n".join(lines)
+
+    def distances(self) -> str:
+        lines = []
+        for character in self.characters:
+            similar = self.random.sample(self.characters, min(10, len(self.characters)))
+            values = sorted((round(self.random.uniform(0.4, 1.0), 6) for _ in similar), reverse=True)
+            pairs = ["{} {}".format(x, y) for x, y in zip(similar, values) if x != character]
+            lines.append(" ".join([character, *pairs]))
+        return "\n".join(lines) + "\n"
+
+    def sentences(self) -> Tuple[str, str]:
+        sentences = []
+        indices = []
+
+        for index in range(self.sentence_count):
+            jp_id, en_id = 2 * index + 1, 2 * index + 2
+
+            words = [self.random.choice(self.entries) for _ in range(self.random.randint(1, 4))]
+            headwords = [(x[0] or x[1])[0] for x in words]
+
+            japanese = "".join(x + self.random.choice(PARTICLES) for x in headwords) + "。"
+            english = " ".join(x[3][0][0] for x in words).capitalize() + "."
+
+            sentences.append("{}\tjpn\t{}".format(jp_id, japanese))
+            sentences.append("{}\teng\t{}".format(en_id, english))
+            # Tatoeba also contains every other language, which the converter skips
+            if self.random.random() < 0.2:
+                sentences.append("{}\tdeu\t{}".format(2 * self.sentence_count + index + 1, english))
+
+            parameters = []
+            for headword, (kanji, readings, _, senses) in zip(headwords, words):
+                parameter = headword
+                if kanji and self.random.random() < 0.5:
+                    parameter += "({})".format(readings[0])
+                if self.random.random() < 0.3:
+                    parameter += "[{:02d}]".format(self.random.randint(1, len(senses)))
+                # Most, but not all, indices are verified
+                if self.random.random() < 0.8:
+                    parameter += "~"
+                parameters.append(parameter)
+
+            indices.append("{}\t{}\t{}".format(jp_id, en_id, " ".join(parameters)))
+
+        return "\n".join(sentences) + "\n", "\n".join(indices) + "\n"
+
+
+# A stroke order diagram in the layout KanjiVG uses, including its DTD and kvg: attributes
+KANJIVG_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<!--
+Copyright (C) 2009/2010/2011 Ulrich Apel.
+This work is distributed under the conditions of the Creative Commons
+Attribution-Share Alike 3.0 Licence. This means you are free:
+* to Share - to copy, distribute and transmit the work
+* to Remix - to adapt the work
+-->
+<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.0//EN" "http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/svg10.dtd" [
+<!ATTLIST g
+xmlns:kvg CDATA #FIXED "http://kanjivg.tagaini.net"
+kvg:element CDATA #IMPLIED
+kvg:radical CDATA #IMPLIED >
+<!ATTLIST path
+xmlns:kvg CDATA #FIXED "http://kanjivg.tagaini.net"
+kvg:type CDATA #IMPLIED >
+]>
+<svg xmlns="http://www.w3.org/2000/svg" width="109" height="109" viewBox="0 0 109 109">
+<g id="kvg:StrokePaths_{code}" style="fill:none;stroke:#000000;stroke-width:3;stroke-linecap:round;stroke-linejoin:round;">
+<g id="kvg:{code}" kvg:element="{character}">
+{paths}
+</g>
+</g>
+<g id="kvg:StrokeNumbers_{code}" style="font-size:8;fill:#808080">
+{numbers}
+</g>
+</svg>
+"""
+
+
+def write_kanjivg(path: str, characters: List[str], seed: int = 0):
+    generator = random.Random(seed)
+
+    with tarfile.open(path, "w:xz") as archive:
+        for character in characters:
+            # KanjiVG doesn't cover every kanji in KANJIDIC2
+            if generator.random() < 0.05:
+                continue
+
+            code = "{:05x}".format(ord(character))
+            strokes = range(1, generator.randint(2, 20))
+            paths = "\n".join(
+                '\t<path id="kvg:{}-s{}" kvg:type="㇐" d="M{:.2f},{:.2f}c{:.2f},{:.2f} {:.2f},{:.2f} {:.2f},{:.2f}"/>'.format(
+                    code, x, *(generator.uniform(0, 100) for _ in range(8))) for x in strokes)
+            numbers = "\n".join(
+                '\t<text transform="matrix(1 0 0 1 {:.2f} {:.2f})">{}</text>'.format(
+                    generator.uniform(0, 100), generator.uniform(0, 100), x) for x in strokes)
+
+            data = KANJIVG_TEMPLATE.format(code=code, character=character, paths=paths, numbers=numbers).encode("UTF-8")
+
+            member = tarfile.TarInfo("{}.svg".format(code))
+            member.size = len(data)
+            archive.addfile(member, io.BytesIO(data))
+
+
+def read_prolog(path: str, root_tag: str) -> str:
+    # Everything before the root element, i.e. the XML declaration and the DTD
+    with open(path, encoding="UTF-8") as in_file:
+        text = in_file.read()
+    return text[:text.index("<{}>".format(root_tag))]
+
+
+def write_inputs(directory: str, scale: float, seed: int = 0) -> Dict[str, int]:
+    generator = Generator(scale, seed)
+    generator.generate_entries()
+
+    os.makedirs(directory, exist_ok=True)
+
+    def write(name: str, text: str):
+        with open(os.path.join(directory, name), "w", encoding="UTF-8") as out_file:
+            out_file.write(text)
+
+    write("JMdict_e.xml", "{}<JMdict>\n{}\n</JMdict>\n".format(
+        read_prolog(JMDICT_SAMPLE, "JMdict"), generator.jmdict()))
+
+    write("kanjidic2.xml", "{}<kanjidic2>\n{}\n</kanjidic2>\n".format(
+        read_prolog(KANJIDIC_SAMPLE, "kanjidic2"), generator.kanjidic()))
+
+    write("stroke_distance.csv", generator.distances())
+    write("radical_distance.csv", generator.distances())
+
+    sentences, indices = generator.sentences()
+    write("sentences.csv", sentences)
+    write("jpn_indices.csv", indices)
+
+    write("english.txt", "\n".join(sorted(set(generator.vocabulary))) + "\n")
+
+    return {
+        "entries": generator.entry_count,
+        "characters": generator.character_count,
+        "sentences": generator.sentence_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output", type=str)
+    parser.add_argument("--scale", "-s", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = write_inputs(args.output, args.scale, args.seed)
+    print("Generated {entries} entries, {characters} kanji and {sentences} sentence pairs".format(**counts))
+
+
+if __name__ == "__main__":
+    main()
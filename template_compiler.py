@@ -0,0 +1,81 @@
+import os
+import argparse
+import instrumentation
+
+from jinja2 import Environment, DictLoader, FileSystemLoader, ModuleLoader, FileSystemBytecodeCache, select_autoescape
+
+TEMPLATES = ["japanese_definition_page.html", "kanji_page.html", "english_definition_page.html"]
+
+
+def create_environment(loader) -> Environment:
+    # Both the compiled and the source templates must be rendered with the same settings
+    return Environment(
+        loader=loader,
+        autoescape=select_autoescape(
+            enabled_extensions=('html', 'xml'),
+            default_for_string=True
+        )
+    )
+
+
+def load_environment(compiled_path: str = None, source_path: str = "assets") -> Environment:
+    # Templates compiled ahead of time are imported as Python modules, skipping Jinja's parser and
+    # compiler entirely. Otherwise the source templates are compiled, with the bytecode cached on disk.
+    if compiled_path:
+        return create_environment(ModuleLoader(compiled_path))
+
+    os.makedirs("cache/templates", exist_ok=True)
+    environment = create_environment(FileSystemLoader(source_path))
+    environment.bytecode_cache = FileSystemBytecodeCache("cache/templates")
+    return environment
+
+
+def minify_template(source: str) -> str:
+    # Remove the indentation and line breaks between tags. These only become whitespace-only text
+    # in the output, which xmllint --noblanks removes at the end of the build anyway.
+    lines = [x.strip() for x in source.splitlines()]
+    lines = [x for x in lines if x]
+
+    result = lines[:1]
+    for line in lines[1:]:
+        previous = result[-1]
+        if previous.endswith((">", "%}")) and line.startswith(("<", "{%")):
+            result.append(line)
+        else:
+            # Keep a separator between text (or expressions) that would otherwise run together
+            result.append(" " + line)
+
+    return "".join(result)
+
+
+def compile_templates(source_path: str, target_path: str) -> int:
+    report = instrumentation.current_stage()
+    sources = {}
+
+    for name in TEMPLATES:
+        with open(os.path.join(source_path, name), encoding="UTF-8") as in_file:
+            source = in_file.read()
+        sources[name] = minify_template(source)
+        report.count("source bytes", len(source.encode("UTF-8")))
+        report.count("minified bytes", len(sources[name].encode("UTF-8")))
+
+    environment = create_environment(DictLoader(sources))
+    environment.compile_templates(target_path, zip=None, ignore_errors=False)
+
+    return len(sources)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", type=str, default="assets")
+    parser.add_argument("--output", "-o", type=str, default="output/templates")
+    args = parser.parse_args()
+
+    with instrumentation.stage("template_compiler") as report:
+        report.add_records(compile_templates(args.source, args.output))
+        print("Compiled {} templates ({} bytes minified to {})".format(
+            report.records, report.counters["source bytes"], report.counters["minified bytes"]))
+
+
+if __name__ == "__main__":
+    main()
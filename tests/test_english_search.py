@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import english_entry_generator
+from english_search import EnglishSearch
+
+DICTIONARY = """<dictionary>
+<entry title="赤" priority="1">
+<definition><translation>red (color)</translation><translation>crimson</translation><pos>noun</pos></definition>
+</entry>
+<entry title="赤字" priority="2">
+<definition><translation>red ink</translation><pos>noun</pos></definition>
+</entry>
+<entry title="赤赤" priority="3">
+<definition><translation>red red</translation><pos>adverb</pos></definition>
+</entry>
+<entry title="牛" priority="4">
+<definition><translation>ox (bovine)</translation><translation>cattle</translation><pos>noun</pos></definition>
+</entry>
+</dictionary>
+"""
+
+
+class EnglishSearchTest(unittest.TestCase):
+    def setUp(self):
+        # english_entry_generator reads and writes under output/ in the working directory
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        os.makedirs("output")
+        with open("output/dictionary.xml", "w", encoding="UTF-8") as out_file:
+            out_file.write(DICTIONARY)
+        english_entry_generator.main()
+        self.search = EnglishSearch("output/dictionary.db")
+
+    def tearDown(self):
+        self.search.close()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_base_word_without_explanation(self):
+        self.assertEqual(english_entry_generator.get_base_word("red (color)"), "red")
+        self.assertEqual(english_entry_generator.get_base_word("(to) run (away)"), "run")
+
+    def test_short_query_matches_translation_with_explanation(self):
+        results = self.search.search("ox")
+        self.assertEqual([(x.en, x.explanation, x.jp) for x in results], [("ox", "bovine", "牛")])
+
+    def test_exact_match_first(self):
+        results = self.search.search("red")
+        self.assertEqual(results[0].jp, "赤")
+        self.assertEqual(results[0].en, "red")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,310 @@
+import gc
+import mmap
+import time
+import random
+import argparse
+import tracemalloc
+import instrumentation
+import xml.etree.ElementTree as ElementTree
+
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Layout of a trie file (all integers are native unsigned 32 bit):
+#   header          magic, version, node count, edge count, value count, value blob length
+#   first edges     node_count + 1 indexes into the edges; node n's edges are first_edge[n] until
+#                   first_edge[n + 1], sorted by their label
+#   node values     node_count indexes into the values plus one, or 0 if no key ends at the node
+#   edge labels     edge_count code points
+#   edge targets    edge_count node numbers
+#   value offsets   value_count + 1 offsets into the value blob
+#   value blob      UTF-8 headwords, separated by RECORD_SEPARATOR
+# Node 0 is the root, and the nodes are numbered breadth first.
+MAGIC = 0x5254444a  # "JDTR"
+VERSION = 1
+HEADER_LENGTH = 24
+
+RECORD_SEPARATOR = "\x1e"
+
+
+class TrieIndex:
+    def __init__(self, path: str):
+        with open(path, "rb") as in_file:
+            # Map the file read only so that every process using the index shares the same pages
+            self.map = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.view = memoryview(self.map)
+
+        magic, version, self.node_count, self.edge_count, value_count, _ = self.view[:HEADER_LENGTH].cast("I")
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a version {} trie index".format(path, VERSION))
+
+        lengths = [self.node_count + 1, self.node_count, self.edge_count, self.edge_count, value_count + 1]
+        arrays_end = HEADER_LENGTH + 4 * sum(lengths)
+        arrays = self.view[HEADER_LENGTH:arrays_end].cast("I")
+
+        self.arrays = []
+        start = 0
+        for length in lengths:
+            self.arrays.append(arrays[start:start + length])
+            start += length
+        self.first_edge, self.node_values, self.edge_labels, self.edge_targets, self.value_offsets = self.arrays
+
+        self.value_blob_start = arrays_end
+
+    def _child(self, node: int, character: str) -> int:
+        start, end = self.first_edge[node], self.first_edge[node + 1]
+        label = ord(character)
+        index = bisect_left(self.edge_labels, label, start, end)
+        if index < end and self.edge_labels[index] == label:
+            return self.edge_targets[index]
+        return -1
+
+    def _walk(self, key: str) -> int:
+        node = 0
+        for character in key:
+            node = self._child(node, character)
+            if node == -1:
+                break
+        return node
+
+    def _values(self, node: int) -> List[str]:
+        value = self.node_values[node]
+        if value == 0:
+            return []
+        start = self.value_blob_start + self.value_offsets[value - 1]
+        end = self.value_blob_start + self.value_offsets[value]
+        return self.map[start:end].decode("UTF-8").split(RECORD_SEPARATOR)
+
+    def __len__(self) -> int:
+        return len(self.value_offsets) - 1
+
+    def __contains__(self, key: str) -> bool:
+        node = self._walk(key)
+        return node != -1 and self.node_values[node] != 0
+
+    def get(self, key: str) -> List[str]:
+        # The headwords that key is a title, reading or kanji form of
+        node = self._walk(key)
+        if node == -1:
+            return []
+        return self._values(node)
+
+    def prefix(self, prefix: str, limit: Optional[int] = None) -> Iterator[Tuple[str, List[str]]]:
+        # Every key starting with prefix, in code point order
+        node = self._walk(prefix)
+        if node == -1:
+            return
+
+        found = 0
+        stack = [(prefix, node)]
+        while stack:
+            key, node = stack.pop()
+            if self.node_values[node]:
+                yield key, self._values(node)
+                found += 1
+                if found == limit:
+                    return
+
+            start, end = self.first_edge[node], self.first_edge[node + 1]
+            for index in range(end - 1, start - 1, -1):
+                stack.append((key + chr(self.edge_labels[index]), self.edge_targets[index]))
+
+    def prefixes(self, text: str, start: int = 0) -> List[Tuple[int, List[str]]]:
+        # The lengths (and headwords) of every key that text[start:] starts with, shortest first
+        result = []
+        node = 0
+        for position in range(start, len(text)):
+            node = self._child(node, text[position])
+            if node == -1:
+                break
+            if self.node_values[node]:
+                result.append((position + 1 - start, self._values(node)))
+        return result
+
+    def longest_prefix(self, text: str, start: int = 0) -> Optional[Tuple[int, List[str]]]:
+        node = 0
+        longest = None
+        for position in range(start, len(text)):
+            node = self._child(node, text[position])
+            if node == -1:
+                break
+            if self.node_values[node]:
+                longest = position + 1 - start, node
+
+        if longest is None:
+            return None
+        return longest[0], self._values(longest[1])
+
+    def segment(self, text: str) -> List[Tuple[str, List[str]]]:
+        # Split running text into the longest known words, left to right. Characters that don't
+        # start any known word become segments of their own, without headwords.
+        result = []
+        position = 0
+        while position < len(text):
+            match = self.longest_prefix(text, position)
+            if match is None:
+                result.append((text[position], []))
+                position += 1
+            else:
+                length, headwords = match
+                result.append((text[position:position + length], headwords))
+                position += length
+        return result
+
+    def close(self):
+        for view in self.arrays:
+            view.release()
+        self.view.release()
+        self.map.close()
+
+
+def write_trie(path: str, keys: Dict[str, List[str]]):
+    # Build the trie as nested dicts first, then number the nodes breadth first so that the
+    # edges of every node are stored next to each other
+    root: Dict = {}
+    terminals: Dict[int, str] = {}
+    for key in keys:
+        node = root
+        for character in key:
+            node = node.setdefault(character, {})
+        terminals[id(node)] = key
+
+    first_edge = array("I", [0])
+    node_values = array("I")
+    edge_labels = array("I")
+    edge_targets = array("I")
+    value_offsets = array("I", [0])
+    value_blob = bytearray()
+
+    node_count = 1
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+
+        key = terminals.get(id(node))
+        if key is None:
+            node_values.append(0)
+        else:
+            value_blob += RECORD_SEPARATOR.join(keys[key]).encode("UTF-8")
+            value_offsets.append(len(value_blob))
+            node_values.append(len(value_offsets) - 1)
+
+        for character in sorted(node):
+            edge_labels.append(ord(character))
+            edge_targets.append(node_count)
+            node_count += 1
+            queue.append(node[character])
+        first_edge.append(len(edge_labels))
+
+    header = array("I", [MAGIC, VERSION, len(node_values), len(edge_labels), len(value_offsets) - 1, len(value_blob)])
+
+    with open(path, "wb") as out_file:
+        for values in (header, first_edge, node_values, edge_labels, edge_targets, value_offsets):
+            out_file.write(values.tobytes())
+        out_file.write(value_blob)
+
+    return len(node_values)
+
+
+def read_keys(dictionary_path: str) -> Dict[str, List[str]]:
+    # Every title, reading and kanji form of the entries that get a page (see
+    # JapaneseEntry.is_worth_adding), mapped to the titles of their entries
+    result: Dict[str, List[str]] = {}
+    for _, tag in ElementTree.iterparse(dictionary_path):
+        if tag.tag != "entry":
+            continue
+
+        if any(x.find("translation") is not None for x in tag.findall("definition")):
+            title = tag.attrib["title"]
+            forms = [title]
+            forms += [x.attrib["text"] for x in tag.findall("reading")]
+            forms += [x.attrib["text"] for x in tag.findall("kanji")]
+            for form in dict.fromkeys(forms):
+                titles = result.setdefault(form, [])
+                if title not in titles:
+                    titles.append(title)
+
+        tag.clear()
+    return result
+
+
+def dict_longest_prefix(keys: Dict[str, List[str]], longest_key: int, text: str, start: int):
+    # What longest_prefix has to do without a trie: try every length, longest first
+    for length in range(min(longest_key, len(text) - start), 0, -1):
+        if text[start:start + length] in keys:
+            return length, keys[text[start:start + length]]
+    return None
+
+
+def benchmark(path: str, keys: Dict[str, List[str]], lookups: int = 100000, seed: int = 0):
+    generator = random.Random(seed)
+    queries = generator.choices(list(keys), k=lookups)
+    # Running text made of known words, with a few unknown characters in between
+    text = "".join(x + ("。" if generator.random() < 0.1 else "") for x in queries)
+    longest_key = max(len(x) for x in keys)
+
+    # Memory of the same index as a dict, measured by building a copy of it
+    gc.collect()
+    tracemalloc.start()
+    copy = {key: list(value) for key, value in keys.items()}
+    dict_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    trie = TrieIndex(path)
+    results = []
+
+    for name, lookup in (("dict", copy.get), ("trie", trie.get)):
+        start = time.perf_counter()
+        for query in queries:
+            lookup(query)
+        results.append(("{} exact".format(name), time.perf_counter() - start, len(queries)))
+
+    def segment_dict():
+        position, count = 0, 0
+        while position < len(text):
+            match = dict_longest_prefix(copy, longest_key, text, position)
+            position += match[0] if match else 1
+            count += 1
+        return count
+
+    for name, segment in (("dict", segment_dict), ("trie", lambda: len(trie.segment(text)))):
+        start = time.perf_counter()
+        count = segment()
+        results.append(("{} longest prefix".format(name), time.perf_counter() - start, count))
+
+    print("{} keys: dict {:.1f}MB, trie {:.1f}MB (file, shared between processes)".format(
+        len(keys), dict_memory / 2**20, trie.map.size() / 2**20))
+    for name, duration, count in results:
+        print("    {:<24} {:>10.0f} lookups/s".format(name, count / duration if duration > 0 else 0.0))
+
+    trie.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dictionary", type=str, nargs="?", default="output/dictionary.xml")
+    parser.add_argument("--output", "-o", type=str, default="output/headwords.trie")
+    parser.add_argument("--benchmark", action="store_true", help="compare the trie against a dict afterwards")
+    args = parser.parse_args()
+
+    with instrumentation.stage("trie_index") as report:
+        with report.phase("read keys"):
+            keys = read_keys(args.dictionary)
+
+        with report.phase("write trie", len(keys)):
+            nodes = write_trie(args.output, keys)
+
+        report.add_records(len(keys))
+        report.count("nodes", nodes)
+        print("Indexed {} titles, readings and kanji forms in {} trie nodes".format(len(keys), nodes))
+
+    if args.benchmark:
+        benchmark(args.output, keys)
+
+
+if __name__ == "__main__":
+    main()